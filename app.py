@@ -1,34 +1,117 @@
 import streamlit as st
 import os
-from google.cloud import aiplatform
-import google.generativeai as genai
-from google.oauth2 import service_account
-import PyPDF2
-import docx
-import io
+import time
+import threading
+from contextlib import closing
 import json
-import fitz  # PyMuPDF for better PDF handling
+from clients import FakeModel, get_context_cache, get_shared_client, load_service_account_credentials, ModelClient
+from caching import (
+    content_hash, CountedLRUCache, FlightAbandoned, get_extraction_cache, get_response_cache, get_single_flight,
+    ResponseCache,
+)
+from extraction import (
+    count_pages, DocumentTooLarge, iter_document_pages, MIN_PAGE_QUALITY, PDF_TYPE, spill_to_file,
+    SUPPORTED_TYPES,
+)
+from prompts import (
+    ANALYSIS_PROMPTS, CROSS_DOCUMENT_PROMPT, EXCERPT_QUESTION_PROMPT, PROMPT_VERSION, QUESTION_ASK, QUESTION_DOCUMENT,
+    QUESTION_PROMPT, RISK_DIGEST, UPDATE_ANALYSIS_PROMPT,
+)
+from prescan import context, format_digest, get_findings, RULE_LABELS
+from document import cache_document_model, DocumentModelBuilder, get_document_model
+from jobs import DONE, get_job_queue
+from retrieval import format_passages, get_document_index
+from scheduler import ANALYSIS, INTERACTIVE, get_scheduler
+from similarity import format_changes, format_diff, get_changes, get_signature, get_similarity_index
+from summarizer import MapReduceSummarizer
+from tokens import cached_tokens, load_tokenizer, TokenAccountant, trim_to_budget, usage_tokens
+from tracing import get_tracer
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+MODEL_NAME = "gemini-1.5-flash"
+# Context caching only accepts versioned model names
+CONTEXT_CACHE_MODEL_NAME = "gemini-1.5-flash-002"
 
 class LegalDocumentAI:
     def __init__(self):
-        self.setup_google_cloud()
+        # Connecting is deferred to the first model call; the client and its
+        # credentials are created once per process and shared by every session
+        self._model = None
+        self.tokens = TokenAccountant(
+            load_tokenizer(), max_prompt_tokens=int(os.getenv("MAX_PROMPT_TOKENS", 100000))
+        )
+        self.summarizer = MapReduceSummarizer(
+            self._generate,
+            chunk_chars=int(os.getenv("SUMMARY_CHUNK_CHARS", 60000)),
+            max_workers=int(os.getenv("SUMMARY_MAX_WORKERS", 4)),
+            count_tokens=self.tokens.count,
+            max_prompt_tokens=self.tokens.max_prompt_tokens,
+        )
+        self.retrieval_min_chars = int(os.getenv("RETRIEVAL_MIN_CHARS", 12000))
+        self.retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", 6))
+        # Scheduler priority for document analyses; questions always go first as INTERACTIVE
+        self.priority = ANALYSIS
+        # Uploads larger than this are spilled to a temp file instead of being copied in memory
+        self.upload_spill_bytes = int(os.getenv("UPLOAD_SPILL_BYTES", 16 * 1024 * 1024))
+        self.upload_spill_dir = os.getenv("UPLOAD_SPILL_DIR") or None
+        # Bytes of uploads and their text this session may hold at once, across all of its documents
+        self.session_memory_limit = int(os.getenv("SESSION_MEMORY_LIMIT_BYTES", 512 * 1024 * 1024))
+        self._held_bytes = {}  # Upload name -> bytes held for it, counted against session_memory_limit
+        self._held_lock = threading.Lock()
+        # Per-page extraction stats for this session's recent documents, keyed by document hash
+        self.page_stats = CountedLRUCache(8)
+        # Analyses allowed in flight while further uploads are extracted, for multi-document uploads
+        self.pipeline_depth = int(os.getenv("DOCUMENT_PIPELINE_DEPTH", 2))
+        # When the risks analysis reads the local pre-scan digest instead of the document:
+        # "long" (documents that would otherwise be chunked), "always" or "never"
+        self.risk_digest_mode = os.getenv("RISKS_FROM_DIGEST", "long").lower()
+        # "gemini", or "fake" for offline runs and benchmarks without Google Cloud access
+        self.model_backend = os.getenv("MODEL_BACKEND", "gemini").lower()
+        # Estimated share of wording an upload must have in common with an earlier document (numbers aside)
+        # for that document's analyses to be offered and updated for the changes alone
+        self.similarity_threshold = float(os.getenv("SIMILAR_DOCUMENT_THRESHOLD", 0.85))
+        # Opt-in: questions on documents of at least context_cache_min_tokens that fit in one request send
+        # the whole document once as a cached model context, then only the question, in place of retrieved
+        # passages: "never", "auto" or "always"
+        self.context_cache_mode = os.getenv("CONTEXT_CACHE", "never").lower()
+        self.context_cache_min_tokens = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", 32768))
+        self.context_cache_model = os.getenv("CONTEXT_CACHE_MODEL", CONTEXT_CACHE_MODEL_NAME)
         
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = get_shared_client((self.model_backend, MODEL_NAME), self.create_model)
+            if self._model is None:
+                raise RuntimeError("AI services are not connected")
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+    
+    def create_model(self):
+        """Create the model for the configured backend (None if unavailable)"""
+        if self.model_backend == "fake":
+            return FakeModel.from_env()
+        if self.model_backend != "gemini":
+            st.error(f"❌ Unknown MODEL_BACKEND: {self.model_backend}")
+            return None
+        return self.setup_google_cloud()
+    
     def setup_google_cloud(self):
-        """Initialize Google Cloud services"""
+        """Initialize Google Cloud services and return the Gemini model (None if unavailable)"""
+        # Imported here so app start-up doesn't pay for the Google SDKs
+        from google.cloud import aiplatform
+        import google.generativeai as genai
+        
         try:
             # Load service account key
             if os.path.exists("service-account-key.json"):
-                credentials = service_account.Credentials.from_service_account_file(
-                    "service-account-key.json"
-                )
+                credentials = load_service_account_credentials(path="service-account-key.json")
                 
                 # Configure Gemini
                 genai.configure(credentials=credentials)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
+                model = ModelClient(genai.GenerativeModel(MODEL_NAME), credentials)
                 
                 # Initialize Vertex AI
                 with open("service-account-key.json") as f:
@@ -42,183 +125,896 @@ class LegalDocumentAI:
                 )
                 
                 st.success("✅ AI services connected successfully!")
-                return True
+                return model
                 
         except Exception as e:
             st.error(f"❌ Error connecting to AI services: {str(e)}")
-            return False
+            return None
     
-    def extract_text_from_file(self, uploaded_file):
-        """Extract text from uploaded document (text-based files only)"""
-        text = ""
+    def extract_text_from_file(self, uploaded_file, on_page=None):
+        """Extract text from uploaded document, parsing each distinct file only once
         
-        try:
-            if uploaded_file.type == "application/pdf":
-                # Try PyMuPDF first (better for complex PDFs)
-                try:
-                    file_bytes = uploaded_file.read()
-                    pdf_document = fitz.open(stream=file_bytes, filetype="pdf")
-                    
-                    for page_num in range(pdf_document.page_count):
-                        page = pdf_document[page_num]
-                        
-                        # Extract text directly from PDF
-                        page_text = page.get_text()
-                        text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-                    
-                    pdf_document.close()
-                    
-                except Exception as e:
-                    st.warning(f"PyMuPDF failed, trying PyPDF2: {str(e)}")
-                    # Fallback to PyPDF2
-                    uploaded_file.seek(0)  # Reset file pointer
-                    pdf_reader = PyPDF2.PdfReader(io.BytesIO(uploaded_file.read()))
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-                        
-            elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                # Handle Word documents
-                doc = docx.Document(io.BytesIO(uploaded_file.read()))
-                for paragraph in doc.paragraphs:
-                    text += paragraph.text + "\n"
-                    
-            elif uploaded_file.type == "text/plain":
-                # Handle text files
-                text = uploaded_file.read().decode("utf-8")
-                
-            else:
+        on_page, if given, is called as on_page(page_number, page_count, page_text) as each page is parsed.
+        """
+        tracer = get_tracer()
+        with tracer.span("extract", file_name=uploaded_file.name, file_type=uploaded_file.type) as extract_span:
+            if uploaded_file.type not in SUPPORTED_TYPES:
                 st.error(f"Unsupported file type: {uploaded_file.type}")
                 return ""
             
+            cache = get_extraction_cache()
+            # A view of the upload's own buffer, so hashing and spilling it make no copy
+            with uploaded_file.getbuffer() as buffer:
+                extract_span.set(bytes=len(buffer))
+                with tracer.span("cache_lookup") as lookup_span:
+                    cache_key = cache.make_key(buffer, uploaded_file.type)
+                    cached_text = cache.get(cache_key)
+                    lookup_span.set(hit=cached_text is not None)
+                if cached_text is not None:
+                    extract_span.set(cache_hit=True, chars=len(cached_text), document=self._document_hash(cached_text))
+                    try:
+                        self._hold(uploaded_file.name, len(cached_text))
+                    except DocumentTooLarge as e:
+                        st.error(f"Error processing file: {str(e)}")
+                        return ""
+                    return cached_text
+                
+                with tracer.span("read_upload") as read_span:
+                    source = self._document_source(buffer, uploaded_file.name)
+                    read_span.set(spilled=isinstance(source, str))
+            
+            try:
+                text = self._extract_pages(source, uploaded_file.name, uploaded_file.type, extract_span, on_page)
+            finally:
+                if isinstance(source, str):
+                    os.remove(source)
+            if text:
+                cache.set(cache_key, text)
+            return text
+    
+    def _document_source(self, buffer, file_name):
+        """Uploads above the spill threshold go to a temp file the parsers read from; smaller ones stay as bytes"""
+        if len(buffer) > self.upload_spill_bytes:
+            return spill_to_file(buffer, suffix=os.path.splitext(file_name)[1], directory=self.upload_spill_dir)
+        return bytes(buffer)
+    
+    def _hold(self, name, held_bytes):
+        """Count held_bytes for the upload name against the session's memory limit, raising DocumentTooLarge past it"""
+        with self._held_lock:
+            others = sum(size for key, size in self._held_bytes.items() if key != name)
+            if others + held_bytes > self.session_memory_limit:
+                self._held_bytes.pop(name, None)
+                raise DocumentTooLarge(
+                    f"the uploaded documents need more than this session's "
+                    f"{self.session_memory_limit // (1024 * 1024)} MB memory limit; try fewer or smaller files"
+                )
+            self._held_bytes[name] = held_bytes
+    
+    def keep_uploads(self, names):
+        """Stop counting uploads other than names against the memory limit (the session no longer has them)"""
+        names = set(names)
+        with self._held_lock:
+            for name in [name for name in self._held_bytes if name not in names]:
+                del self._held_bytes[name]
+    
+    def release_uploads(self, names):
+        """Stop counting the named uploads against the memory limit"""
+        with self._held_lock:
+            for name in names:
+                self._held_bytes.pop(name, None)
+    
+    def _extract_pages(self, source, name, file_type, extract_span, on_page):
+        tracer = get_tracer()
+        page_count = count_pages(source, file_type) if on_page else None
+        builder = DocumentModelBuilder()
+        page_stats = []
+        # Bytes held for the document while it is read: the in-memory upload plus the text, twice over once joined
+        held_bytes = 0 if isinstance(source, str) else len(source)
+        parse_span = tracer.start_span("parse.pymupdf" if file_type == PDF_TYPE else "parse")
+        
+        def warn(message):
+            # Split the timing so PyMuPDF and the PyPDF2 fallback show up separately
+            nonlocal parse_span
+            parse_span.error = message
+            parse_span.set(pages=builder.pages)
+            parse_span.end()
+            parse_span = tracer.start_span("parse.pypdf2_fallback")
+            st.warning(message)
+        
+        try:
+            with closing(self.iter_pages(source, file_type, warn=warn, stats=page_stats)) as page_records:
+                for page_number, page_text in page_records:
+                    held_bytes += 2 * len(page_text)
+                    self._hold(name, held_bytes)
+                    builder.add(page_number, page_text)
+                    if on_page:
+                        on_page(page_number, page_count, page_text)
         except Exception as e:
+            parse_span.error = str(e)
             st.error(f"Error processing file: {str(e)}")
             return ""
-            
-        return text.strip()
+        finally:
+            parse_span.set(pages=builder.pages)
+            parse_span.end()
+        
+        with tracer.span("join"):
+            text, model = builder.build()
+        self._hold(name, len(text))  # Once joined, the session keeps just the text
+        document_hash = self._document_hash(text)
+        cache_document_model(document_hash, model)
+        extract_span.set(cache_hit=False, pages=builder.pages, chars=len(text), document=document_hash)
+        if page_stats:
+            self._record_page_stats(document_hash, page_stats, extract_span)
+        return text
+    
+    def _record_page_stats(self, document_hash, page_stats, extract_span):
+        """Keep per-page parser, timing and quality for the debug panel, and flag pages PyPDF2 had to rescue"""
+        self.page_stats.set(document_hash, page_stats)
+        fallback_pages = [s.page_number for s in page_stats if s.parser == "pypdf2"]
+        slowest = max(page_stats, key=lambda s: s.seconds)
+        extract_span.set(
+            fallback_pages=len(fallback_pages),
+            failed_pages=sum(1 for s in page_stats if s.error),
+            low_quality_pages=sum(1 for s in page_stats if s.quality < MIN_PAGE_QUALITY),
+            slowest_page=slowest.page_number,
+            slowest_page_ms=round(slowest.seconds * 1000, 1),
+        )
+        if fallback_pages:
+            listed = ", ".join(map(str, fallback_pages[:10])) + ("..." if len(fallback_pages) > 10 else "")
+            st.warning(f"PyMuPDF couldn't read {len(fallback_pages)} page(s) cleanly ({listed}); PyPDF2 was used for those")
+    
+    def iter_pages(self, source, file_type, warn=st.warning, stats=None):
+        """Yield (page_number, text) records as the document is parsed (text-based files only)"""
+        return iter_document_pages(source, file_type, warn=warn, stats=stats)
     
     def simplify_legal_text(self, text, analysis_type="summary"):
         """Use AI to simplify legal document with finance-focused prompts"""
-        
-        prompts = {
-            "summary": f"""
-            You are a financial and legal expert who specializes in explaining complex legal documents that impact people's money and financial well-being.
-            
-            Please analyze this legal document and provide:
-            1. **Plain English Summary**: What is this document about? (as if explaining to someone with no legal background)
-            2. **Financial Impact**: How will this affect the person's money, assets, or financial obligations?
-            3. **Key Terms & Conditions**: What are the most important rules they need to follow?
-            4. **Cost Breakdown**: All fees, charges, penalties, and potential additional costs
-            5. **Your Rights**: What protections and rights do you have?
-            6. **Red Flags**: Any concerning clauses that could lead to financial loss
-            
-            Legal Document:
-            {text}
-            
-            Please use simple language and focus on the financial implications. Highlight any terms that could cost money or create financial obligations.
-            """,
-            
-            "risks": f"""
-            You are a financial advisor helping someone understand the financial and legal risks in this document.
-            
-            Analyze this document and identify:
-            1. **Financial Risks**: 
-               - Hidden fees, charges, or penalties
-               - Variable costs that could increase
-               - Situations where you might owe money
-               - Impact on credit score or financial standing
-            
-            2. **Legal Obligations**: 
-               - What you MUST do (and what it costs if you don't)
-               - Deadlines and time-sensitive requirements
-               - Automatic renewals or extensions
-            
-            3. **Rights You're Giving Up**: 
-               - Ability to sue or seek damages
-               - Privacy rights with your data
-               - Freedom to choose alternatives
-            
-            4. **Exit Costs**: 
-               - Cancellation fees or penalties
-               - Early termination costs
-               - What happens to deposits or payments made
-            
-            5. **Warning Signs**: 
-               - Unusual or one-sided clauses
-               - Terms that seem too good to be true
-               - Vague language around costs
-            
-            Legal Document:
-            {text}
-            
-            For each risk, explain the potential financial impact and provide practical advice on how to protect yourself.
-            """,
-            
-            "questions": f"""
-            You are helping someone prepare smart questions to ask before signing this legal document to protect their financial interests.
-            
-            Based on this document, here are the important questions they should ask:
-            
-            **About Money & Costs:**
-            1. What are ALL the fees involved? (setup, monthly, annual, hidden charges)
-            2. Can costs increase over time? By how much and how often?
-            3. What triggers penalty fees and how much are they?
-            4. Are there any situations where I might owe additional money?
-            
-            **About Terms & Flexibility:**
-            5. Can I cancel this agreement? What does it cost to get out?
-            6. What happens if I miss a payment or deadline?
-            7. Does this automatically renew? How do I opt out?
-            8. Can you change the terms without my agreement?
-            
-            **About Protection & Rights:**
-            9. What happens if you don't deliver what's promised?
-            10. Do I have any recourse if there's a dispute?
-            11. Is my personal/financial information protected?
-            12. What are my rights if something goes wrong?
-            
-            **About Specific Clauses:**
-            [Based on the document content, add 3-5 specific questions about unclear or concerning terms]
-            
-            Legal Document:
-            {text}
-            
-            Provide specific questions tailored to this document that will help them make an informed financial decision.
-            """
-        }
-        
         try:
-            prompt = prompts.get(analysis_type, prompts["summary"])
-            response = self.model.generate_content(prompt)
-            return response.text
-            
+            return self._analyze(text, analysis_type)
         except Exception as e:
             return f"Error analyzing document: {str(e)}"
     
-    def analyze_specific_clause(self, text, user_question):
-        """Answer specific questions about the document with financial focus"""
-        prompt = f"""
-        You are a financial and legal expert helping someone understand their legal document, particularly focusing on financial implications.
+    def _analyze(self, text, analysis_type):
+        """simplify_legal_text, raising errors rather than returning them as the result"""
+        if analysis_type not in ANALYSIS_PROMPTS:
+            analysis_type = "summary"
+        document_hash = self._document_hash(text)
+        with get_tracer().span("analysis", analysis_type=analysis_type, document=document_hash):
+            return self._cached(
+                self._analysis_cache_key(text, analysis_type),
+                lambda: self._generate(
+                    self._analysis_prompt(text, analysis_type, document_hash),
+                    label=analysis_type,
+                    document=document_hash,
+                ),
+            )
+    
+    def _stream_analysis(self, text, analysis_type):
+        """_analyze, yielding the response as the model streams it"""
+        if analysis_type not in ANALYSIS_PROMPTS:
+            analysis_type = "summary"
+        document_hash = self._document_hash(text)
+        yield from self._cached_stream(
+            "analysis",
+            self._analysis_cache_key(text, analysis_type),
+            lambda: self._analysis_prompt(text, analysis_type, document_hash),
+            label=analysis_type,
+            document=document_hash,
+        )
+    
+    def submit_analysis(self, text, analysis_type="summary", name=None):
+        """Run an analysis as a background job keyed by document and analysis type, returning the Job to poll
         
-        Document: {text}
+        The job outlives the Streamlit run that submitted it, and a second submit of the same key (a rerun,
+        another session) joins the job already in flight. It streams, so job.parts shows the text so far.
+        Errors fail the job, so the next submit retries it; once it succeeds the document is indexed for
+        near-duplicate matching under name.
+        """
+        if analysis_type not in ANALYSIS_PROMPTS:
+            analysis_type = "summary"
+        self._connect()
         
-        Question: {user_question}
+        def run(job):
+            for chunk in self._stream_analysis(text, analysis_type):
+                job.append(chunk)
+            self.remember_document(text, name)
+            return "".join(job.parts)
         
-        Please provide a clear, practical answer that:
-        1. Directly answers their question in simple terms
-        2. Explains any financial impact or cost implications
-        3. Highlights risks or benefits they should know about
-        4. Suggests practical next steps or things to watch out for
+        return get_job_queue().submit((self._document_hash(text), analysis_type), run)
+    
+    def submit_update(self, match, text, analysis_type="summary"):
+        """_update_analysis as a background job, like submit_analysis"""
+        self._connect()
+        return get_job_queue().submit(
+            (self._document_hash(text), f"{analysis_type}:update", match.key),
+            lambda job: self._update_analysis(match, text, analysis_type),
+        )
+    
+    def _connect(self):
+        try:
+            self.model  # Connect on this (the script's) thread, not in a job worker
+        except RuntimeError:
+            pass  # The job fails with it, and is retried on the next submit
+    
+    def analyze_documents(self, uploaded_files, analysis_type="summary", in_flight=0):
+        """Extract uploads one after another and queue each one's analysis as a background job
         
-        Focus on how this affects their money, rights, and financial security.
+        Yields ("extracted", index, text) when a file's text is ready and ("submitted", index, job) once its
+        analysis is queued (see submit_analysis). Stops rather than waits once pipeline_depth analyses,
+        counting in_flight ones queued by an earlier call, are unfinished, so a large batch never has every
+        document's text waiting in memory; call it again with the rest once some have finished.
         """
+        self._connect()
+        running = []
+        for index, uploaded_file in enumerate(uploaded_files):
+            running = [job for job in running if not job.done]
+            if in_flight + len(running) >= self.pipeline_depth:
+                return
+            text = self.extract_text_from_file(uploaded_file)
+            yield "extracted", index, text
+            if text.strip():
+                job = self.submit_analysis(text, analysis_type, name=uploaded_file.name)
+                running.append(job)
+                yield "submitted", index, job
+    
+    def submit_combined(self, named_results, analysis_type="summary"):
+        """Queue one review across several documents, built from their analyses rather than their full text
+        
+        named_results holds (name, document hash, analysis) per document. As with submit_analysis, the same
+        set submitted again returns the job already queued or done.
+        """
+        documents = "\n\n".join(f"### Document: {name}\n{result.strip()}" for name, _, result in named_results)
+        set_hash = content_hash("|".join(document_hash for _, document_hash, _ in named_results).encode("utf-8"))
+        cache_key = ResponseCache.make_key(set_hash, f"combined:{analysis_type}", PROMPT_VERSION, self._model_name())
+        self._connect()
         
+        def build_prompt():
+            overhead = self.tokens.count(CROSS_DOCUMENT_PROMPT.format(documents=""))
+            trimmed = trim_to_budget(documents, self.tokens.max_prompt_tokens - overhead, self.tokens.count)
+            return CROSS_DOCUMENT_PROMPT.format(documents=trimmed)
+        
+        def run(job):
+            with get_tracer().span("combine", documents=len(named_results), document=set_hash):
+                return self._cached(
+                    cache_key, lambda: self._generate(build_prompt(), label="combined", document=set_hash)
+                )
+        
+        return get_job_queue().submit((set_hash, f"combined:{analysis_type}"), run)
+    
+    def remember_document(self, text, name=None):
+        """Index an analysed document so later uploads built from the same template can reuse its analyses"""
+        document_hash = self._document_hash(text)
+        get_similarity_index().add(document_hash, text, name, get_signature(document_hash, text))
+    
+    def find_similar(self, text):
+        """The closest earlier document at or above similarity_threshold (a similarity.Match), or None"""
+        document_hash = self._document_hash(text)
+        with get_tracer().span("similarity_lookup", document=document_hash) as lookup_span:
+            matches = get_similarity_index().query(get_signature(document_hash, text), self.similarity_threshold)
+            matches = [match for match in matches if match.key != document_hash]
+            lookup_span.set(matches=len(matches))
+        return matches[0] if matches else None
+    
+    def prior_analysis(self, match, analysis_type):
+        """The matched document's cached analysis of this type, or None if it has none"""
+        prior_text = get_similarity_index().text(match.key)
+        if prior_text is None:
+            return None
+        return get_response_cache().peek(self._analysis_cache_key(prior_text, analysis_type))
+    
+    def document_changes(self, match, text):
+        """Clauses that differ between the matched document and this one (similarity.Change records)"""
+        prior_text = get_similarity_index().text(match.key) or ""
+        return get_changes(match.key, prior_text, self._document_hash(text), text)
+    
+    def _update_analysis(self, match, text, analysis_type):
+        """Adapt the matched document's analysis to this one, sending the model only the clauses that changed"""
+        prior = self.prior_analysis(match, analysis_type)
+        if prior is None:
+            return self._analyze(text, analysis_type)
+        document_hash = self._document_hash(text)
+        cache_key = ResponseCache.make_key(
+            document_hash, f"{analysis_type}:update", match.key, PROMPT_VERSION, self._model_name()
+        )
+        
+        def build_prompt():
+            changes = format_changes(self.document_changes(match, text), max_chars=self.summarizer.chunk_chars)
+            overhead = self.tokens.count(UPDATE_ANALYSIS_PROMPT.format(analysis=prior, changes=""))
+            changes = trim_to_budget(changes, self.tokens.max_prompt_tokens - overhead, self.tokens.count)
+            return UPDATE_ANALYSIS_PROMPT.format(analysis=prior, changes=changes)
+        
+        with get_tracer().span("analysis", analysis_type=analysis_type, document=document_hash, updated_from=match.key):
+            return self._cached(
+                cache_key,
+                lambda: self._generate(build_prompt(), label=f"{analysis_type} (update)", document=document_hash),
+            )
+    
+    def analyze_specific_clause(self, text, user_question):
+        """Answer specific questions about the document with financial focus"""
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            document_hash = self._document_hash(text)
+            
+            def answer():
+                context = self._document_context(document_hash, text)
+                return self._generate(
+                    self._question_prompt(document_hash, text, user_question, context),
+                    priority=INTERACTIVE,
+                    label="question",
+                    document=document_hash,
+                    context=context,
+                )
+            
+            with get_tracer().span("question", document=document_hash):
+                return self._cached(self._question_cache_key(document_hash, user_question), answer)
         except Exception as e:
             return f"Error: {str(e)}"
+    
+    def stream_specific_clause(self, text, user_question):
+        """Same as analyze_specific_clause, but yields the answer as the model streams it"""
+        try:
+            document_hash = self._document_hash(text)
+            yield from self._cached_stream(
+                "question",
+                self._question_cache_key(document_hash, user_question),
+                lambda context: self._question_prompt(document_hash, text, user_question, context),
+                priority=INTERACTIVE,
+                label="question",
+                document=document_hash,
+                get_context=lambda: self._document_context(document_hash, text),
+            )
+        except Exception as e:
+            yield f"Error: {str(e)}"
+    
+    def _analysis_cache_key(self, text, analysis_type):
+        if analysis_type == "risks" and self._use_risk_digest(text):
+            analysis_type = "risks:digest"
+        return ResponseCache.make_key(
+            self._document_hash(text), analysis_type, PROMPT_VERSION, self._model_name()
+        )
+    
+    def _use_risk_digest(self, text):
+        if self.risk_digest_mode == "always":
+            return True
+        return self.risk_digest_mode == "long" and len(text) > self.summarizer.chunk_chars
+    
+    def _question_cache_key(self, document_hash, user_question):
+        return ResponseCache.make_key(
+            document_hash,
+            "question",
+            " ".join(user_question.lower().split()),
+            PROMPT_VERSION,
+            self._model_name(),
+        )
+    
+    def _analysis_prompt(self, text, analysis_type, document_hash):
+        """Long documents are chunked and summarised in parallel before the final call"""
+        with get_tracer().span("build_prompt", chars=len(text)) as prompt_span:
+            if analysis_type == "risks" and self._use_risk_digest(text):
+                prompt = self._risk_digest_prompt(document_hash, text)
+                if prompt is not None:
+                    prompt_span.set(prompt_chars=len(prompt), digest=True)
+                    return prompt
+            prompt = self.summarizer.final_prompt(
+                text, analysis_type, structure=get_document_model(document_hash, text), document=document_hash
+            )
+            prompt_span.set(prompt_chars=len(prompt))
+            return prompt
+    
+    def _risk_digest_prompt(self, document_hash, text):
+        """The risks prompt over the pre-scan's matching clauses, in one call (None if the scan found nothing)"""
+        findings = get_findings(document_hash, text)
+        if not findings:
+            return None
+        template = ANALYSIS_PROMPTS["risks"]
+        overhead = self.tokens.count(template.format(text=RISK_DIGEST.format(digest="")))
+        digest = format_digest(get_document_model(document_hash, text), findings, max_chars=self.summarizer.chunk_chars)
+        digest = trim_to_budget(digest, self.tokens.max_prompt_tokens - overhead, self.tokens.count)
+        return template.format(text=RISK_DIGEST.format(digest=digest))
+    
+    def _question_prompt(self, document_hash, text, user_question, context=None):
+        """Just the question when sent against the document's cached context (from _document_context);
+        otherwise short documents go in whole and long ones send only the most relevant passages"""
+        tracer = get_tracer()
+        with tracer.span("build_prompt", chars=len(text)) as prompt_span:
+            if context is not None:
+                prompt = QUESTION_ASK.format(user_question=user_question)
+                prompt_span.set(prompt_chars=len(prompt), cached_context=True)
+                return prompt
+            if len(text) <= self.retrieval_min_chars:
+                template, field = QUESTION_PROMPT, "text"
+            else:
+                with tracer.span("retrieval", top_k=self.retrieval_top_k):
+                    passages = self._relevant_passages(document_hash, text, user_question)
+                template, field, text = EXCERPT_QUESTION_PROMPT, "passages", format_passages(passages)
+            
+            # Trim the document part, never the instructions, if the prompt would exceed the budget
+            overhead = self.tokens.count(template.format(**{field: ""}, user_question=user_question))
+            text = trim_to_budget(text, self.tokens.max_prompt_tokens - overhead, self.tokens.count)
+            prompt = template.format(**{field: text}, user_question=user_question)
+            prompt_span.set(prompt_chars=len(prompt))
+            return prompt
+    
+    def _document_context(self, document_hash, text):
+        """The model with this document's question prefix in its context cache, or None if it isn't cached
+        
+        Created once per document and process on the first question, and shared by every session; whether
+        a document qualifies (and any failure to cache it) is remembered for as long as a context would live.
+        """
+        if self.context_cache_mode not in ("auto", "always"):
+            return None
+        
+        def create(ttl_seconds):
+            prefix = QUESTION_DOCUMENT.format(text=text)
+            prefix_tokens = self.tokens.count(prefix)
+            # The prefix plus a question must still fit in one request
+            if prefix_tokens > self.tokens.max_prompt_tokens * 0.9:
+                return None
+            if self.context_cache_mode == "auto" and prefix_tokens < self.context_cache_min_tokens:
+                return None
+            with get_tracer().span("context_cache", document=document_hash, prompt_tokens=prefix_tokens):
+                return model.cache_context(prefix, ttl_seconds, model_name=self.context_cache_model)
+        
+        model = self.model  # Not connected is an error for the question, not a reason to skip caching it
+        return get_context_cache().get((self._model_name(), document_hash, PROMPT_VERSION), create)
+    
+    def _relevant_passages(self, document_hash, text, user_question, top_k=None):
+        """Best-matching passages, plus any clause the question names by number"""
+        index = get_document_index(document_hash, text)
+        passages = index.search(user_question, top_k or self.retrieval_top_k)
+        for offset in get_document_model(document_hash, text).referenced_clauses(user_question):
+            passage = index.passage_at(offset)
+            if passage is not None and passage not in passages:
+                passages.append(passage)
+        return passages
+    
+    def highlighted_passages(self, text, user_question, top_k=3):
+        """(page_number, markdown) for the passages most relevant to a question, amounts, dates and terms in bold"""
+        document_hash = self._document_hash(text)
+        model = get_document_model(document_hash, text)
+        return [
+            (passage.page, model.highlight(passage.start, passage.end))
+            for passage in self._relevant_passages(document_hash, text, user_question, top_k)
+        ]
+    
+    def _cached(self, cache_key, compute):
+        """Return a cached response for cache_key, calling compute only on a miss"""
+        cache = get_response_cache()
+        with get_tracer().span("cache_lookup") as lookup_span:
+            cached_response = cache.get(cache_key)
+            lookup_span.set(hit=cached_response is not None)
+        if cached_response is not None:
+            return cached_response
+        
+        response_text = compute()
+        cache.set(cache_key, response_text)
+        return response_text
+    
+    def _cached_stream(self, trace_name, cache_key, build_prompt, priority=None, label=None, document=None,
+                       get_context=None):
+        """Streaming counterpart of _cached; the full text is cached once the stream completes
+        
+        get_context, if given, returns the cached model context the prompt is sent against (or None), and
+        build_prompt is then called with it.
+        """
+        # A generator can't hold a span open across yields, so spans are started and ended by hand
+        tracer = get_tracer()
+        root_span = tracer.start_span(trace_name, label=label, document=document, streamed=True)
+        try:
+            cache = get_response_cache()
+            with tracer.activate(root_span), tracer.span("cache_lookup") as lookup_span:
+                cached_response = cache.get(cache_key)
+                lookup_span.set(hit=cached_response is not None)
+            if cached_response is not None:
+                yield cached_response
+                return
+            
+            with tracer.activate(root_span):
+                context = get_context() if get_context else None
+                prompt = build_prompt(context) if get_context else build_prompt()
+                call_span = tracer.start_span("model_call", label=label, prompt_chars=len(prompt))
+            flights = get_single_flight()
+            flight_key = self._flight_key(prompt, context)
+            flight, leader = flights.begin(flight_key)
+            while not leader:
+                # The same prompt is already streaming to another caller; take its full text when it ends
+                try:
+                    response_text = flight.result()
+                except FlightAbandoned:
+                    # That caller stopped reading before the end; stream it from here instead
+                    flight, leader = flights.begin(flight_key)
+                except Exception:
+                    call_span.end()
+                    raise
+                else:
+                    call_span.set(shared=True)
+                    call_span.end()
+                    yield response_text
+                    return
+            call_span.set(shared=False)
+            
+            started = time.perf_counter()
+            parts = []
+            chunk = None
+            response = None
+            try:
+                response = self._generate_content(prompt, priority, label, context, stream=True)
+                for chunk in response:
+                    if not parts:
+                        call_span.set(first_token_ms=round((time.perf_counter() - started) * 1000, 1))
+                    parts.append(chunk.text)
+                    yield chunk.text
+            except BaseException as e:
+                # Includes the reader abandoning the stream, which leaves waiting callers nothing to share
+                flights.finish(flight_key, error=e if isinstance(e, Exception) else FlightAbandoned())
+                raise
+            finally:
+                if response is not None:
+                    response.close()  # Frees the model call's scheduler slot if the stream was cut short
+                call_span.end()
+            response_text = "".join(parts)
+            flights.finish(flight_key, response_text)
+            cache.set(cache_key, response_text)
+            # With streaming, the usage totals arrive on the last chunk
+            self._record_usage(label, document, prompt, response_text, chunk, time.perf_counter() - started, call_span)
+        except Exception as e:
+            root_span.error = str(e)
+            raise
+        finally:
+            root_span.end()
+    
+    def _generate(self, prompt, priority=None, label=None, document=None, context=None):
+        with get_tracer().span("model_call", label=label, prompt_chars=len(prompt)) as call_span:
+            def call():
+                started = time.perf_counter()
+                response = self._generate_content(prompt, priority, label, context)
+                self._record_usage(label, document, prompt, response.text, response, time.perf_counter() - started, call_span)
+                return response.text
+            
+            # An identical prompt already in flight (another session, the same template) is waited for, not resent
+            response_text, shared = get_single_flight().do(self._flight_key(prompt, context), call)
+            call_span.set(shared=shared)
+            return response_text
+    
+    def _generate_content(self, prompt, priority=None, label=None, context=None, **kwargs):
+        """Call the model through the shared scheduler (rate limits, retries, priorities) after checking the token budget
+        
+        With context (from _document_context), the prompt is sent against that cached context.
+        """
+        prompt_tokens = self.tokens.count(prompt)
+        self.tokens.check(prompt_tokens, label)
+        return get_scheduler().call(
+            (context or self.model).generate_content,
+            prompt,
+            priority=self.priority if priority is None else priority,
+            tokens=prompt_tokens,
+            **kwargs,
+        )
+    
+    def _record_usage(self, label, document, prompt, response_text, response, seconds, call_span):
+        """Record a call's token counts, preferring the API's own usage figures over local estimates"""
+        prompt_tokens, completion_tokens = usage_tokens(response)
+        prompt_tokens = prompt_tokens or self.tokens.count(prompt)
+        completion_tokens = completion_tokens or self.tokens.count(response_text)
+        context_tokens = cached_tokens(response)
+        self.tokens.record(label, document, prompt_tokens, completion_tokens, seconds, context_tokens)
+        call_span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=context_tokens)
+    
+    def _flight_key(self, prompt, context=None):
+        # The prompt carries the document text, so this is the normalised text plus the instructions around it;
+        # a prompt sent against a cached context (just the question) is only the same call for the same context
+        return ResponseCache.make_key(
+            content_hash(" ".join(prompt.split()).encode("utf-8")), self._model_name(), id(context) if context else ""
+        )
+    
+    def _document_hash(self, text):
+        return content_hash(text.encode("utf-8"))
+    
+    def _model_name(self):
+        # Keeps fake responses out of the cache entries real model responses are served from
+        return MODEL_NAME if self.model_backend == "gemini" else f"{self.model_backend}:{MODEL_NAME}"
+
+def render_extraction(legal_ai, uploaded_file):
+    """Extract the upload, showing page progress and an early preview until the last page is parsed"""
+    progress = st.empty()
+    preview = st.empty()
+    preview_parts = []
+    
+    def on_page(page_number, page_count, page_text):
+        if page_count:
+            progress.progress(page_number / page_count, text=f"📖 Reading page {page_number} of {page_count}...")
+        if sum(map(len, preview_parts)) < 1500:
+            preview_parts.append(page_text)
+            preview.text("".join(preview_parts)[:1500])
+    
+    with st.spinner("📖 Reading and analyzing your document..."):
+        document_text = legal_ai.extract_text_from_file(uploaded_file, on_page=on_page)
+    progress.empty()
+    preview.empty()
+    return document_text
+
+def render_preview(legal_ai, document_text):
+    """Opening text of the document, with its outline and the amounts and dates found in it"""
+    model = get_document_model(legal_ai._document_hash(document_text), document_text)
+    st.text_area("Document Content", model.preview(1500), height=200)
+    st.caption(
+        f"{len(model.page_starts)} page(s) · {len(model.numbered_clauses)} numbered clauses · "
+        f"{len(model.defined_terms)} defined terms · {len(model.amounts)} amounts · {len(model.dates)} dates"
+    )
+    outline = model.outline()
+    if outline:
+        st.markdown("**Sections:** " + " · ".join(heading for _, heading in outline[:15]))
+    facts = [("💰", page, found) for page, found in model.found(model.amounts)[:10]]
+    facts += [("📅", page, found) for page, found in model.found(model.dates)[:10]]
+    if facts:
+        st.table([{"": icon, "Found": found, "Page": page or ""} for icon, page, found in facts])
+
+PRESCAN_MAX_ROWS = 2000
+
+def render_prescan(legal_ai, document_text):
+    """Instant table of fees, penalties, renewals and deadlines found by the local rule scan"""
+    document_hash = legal_ai._document_hash(document_text)
+    findings = get_findings(document_hash, document_text)
+    if not findings:
+        st.caption("No amounts, fees, penalties or deadlines found by the quick scan.")
+        return
+    model = get_document_model(document_hash, document_text)
+    counts = {}
+    for finding in findings:
+        counts[finding.rule] = counts.get(finding.rule, 0) + 1
+    st.caption(" · ".join(f"{RULE_LABELS[rule]}: {count}" for rule, count in counts.items()))
+    st.dataframe(
+        [
+            {"Found": RULE_LABELS[f.rule], "Term": f.text, "Page": f.page, "Context": context(model, f)}
+            for f in findings[:PRESCAN_MAX_ROWS]
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+    if len(findings) > PRESCAN_MAX_ROWS:
+        st.caption(f"Showing the first {PRESCAN_MAX_ROWS:,} of {len(findings):,} findings")
+
+def render_stream(chunks, spinner_text):
+    """Render streamed text as it arrives and return the full response"""
+    placeholder = st.empty()
+    # The spinner covers the wait for the first token, including any map stage on long documents
+    with st.spinner(spinner_text):
+        parts = [next(chunks, "")]
+    placeholder.markdown(parts[0] + "▌")
+    
+    for chunk in chunks:
+        parts.append(chunk)
+        placeholder.markdown("".join(parts) + "▌")
+    
+    response_text = "".join(parts)
+    placeholder.markdown(response_text)
+    return response_text
+
+def job_result(job):
+    if job.status == DONE:
+        return job.result
+    return f"Error analyzing document: {job.error}"
+
+# How often a waiting page checks on its background jobs
+JOB_POLL_SECONDS = 0.5
 
-def main():
+def render_job(job, spinner_text, stream=True):
+    """Show a background analysis as it stands: the result once it has finished (and return it), else progress
+    
+    Returns None while the job is pending; the caller's fragment draws it again on its next poll.
+    """
+    if job.done:
+        result = job_result(job)
+        st.markdown(result)
+        return result
+    st.caption(f"⏳ {spinner_text} {job.status.capitalize()} · {job.elapsed():.0f}s")
+    if stream and job.parts:
+        st.markdown(job.text + "▌")
+    return None
+
+REPORT_SECTIONS = {
+    "summary": "💡 Simple Summary",
+    "risks": "⚠️ Financial Risks",
+    "questions": "❓ Smart Questions to Ask",
+}
+
+def render_full_report(jobs, stream=True):
+    """Show the report's background analyses as they stand, and return the combined report once all have finished"""
+    sections = {}
+    for analysis_type, job in jobs.items():
+        label = REPORT_SECTIONS[analysis_type]
+        if job.done:
+            sections[analysis_type] = f"## {label}\n\n{job_result(job)}"
+            st.markdown(sections[analysis_type])
+        elif stream and job.parts:
+            st.markdown(f"## {label}\n\n{job.text}▌")
+        else:
+            st.info(f"⏳ {label} {job.status} · {job.elapsed():.0f}s")
+    if len(sections) < len(jobs):
+        return None
+    return "\n\n".join(sections[analysis_type] for analysis_type in jobs)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_pending_analysis(stream=True):
+    """Redraw the session's pending analysis every JOB_POLL_SECONDS without rerunning, or holding up, the page
+    
+    Once the jobs finish, their result moves to session state and the whole page reruns to show it.
+    """
+    pending_jobs = st.session_state.get("analysis_jobs")
+    if not pending_jobs:
+        return
+    spinner_text, jobs = pending_jobs
+    if len(jobs) > 1:
+        result = render_full_report(jobs, stream)
+    else:
+        result = render_job(next(iter(jobs.values())), spinner_text, stream)
+    if result is not None:
+        st.session_state.current_analysis = result
+        del st.session_state.analysis_jobs
+        st.rerun()
+
+DOCUMENT_SET_ANALYSES = {
+    "summary": "Summary",
+    "risks": "Financial Risks",
+    "questions": "Questions to Ask",
+}
+
+def render_document_set(legal_ai, uploaded_files, analysis_type, label, jobs):
+    """Move several uploads' background analyses on and show them as they stand, then a combined review
+    
+    Each call extracts and queues as many more uploads as the pipeline has room for, and returns the
+    report once every analysis and the combined review have finished (None until then). jobs maps each
+    upload's index to its analysis job (None if it had no readable text) as they are submitted; it is
+    kept in session state, so each poll carries on where the last one stopped.
+    """
+    in_flight = sum(1 for job in jobs.values() if job is not None and not job.done)
+    remaining = [index for index in range(len(uploaded_files)) if index not in jobs]
+    batch = legal_ai.analyze_documents([uploaded_files[i] for i in remaining], analysis_type, in_flight)
+    for event, position, value in batch:
+        index = remaining[position]
+        if event == "submitted":
+            jobs[index] = value
+        elif not value.strip():
+            jobs[index] = None
+    
+    for index, uploaded_file in enumerate(uploaded_files):
+        job = jobs.get(index)
+        if index not in jobs:
+            st.info(f"⏳ {uploaded_file.name}: waiting...")
+        elif job is None:
+            st.error(f"❌ {uploaded_file.name}: could not extract readable text")
+        elif job.done:
+            with st.expander(f"{'✅' if job.status == DONE else '❌'} {uploaded_file.name}", expanded=False):
+                st.markdown(job_result(job))
+        else:
+            st.info(f"🧠 {uploaded_file.name}: {label.lower()} {job.status} · {job.elapsed():.0f}s")
+    if len(jobs) < len(uploaded_files) or any(job is not None and not job.done for job in jobs.values()):
+        return None
+    
+    named_results = [
+        (uploaded_files[index].name, jobs[index].key[0], jobs[index].result)
+        for index in sorted(jobs)
+        if jobs[index] is not None and jobs[index].status == DONE
+    ]
+    sections = [f"## {name}\n\n{result}" for name, _, result in named_results]
+    if len(named_results) > 1:
+        st.subheader("🔗 Across All Documents")
+        combined_job = legal_ai.submit_combined(named_results, analysis_type)
+        if not combined_job.done:
+            st.info(f"🔗 Reviewing the documents together... {combined_job.elapsed():.0f}s")
+            return None
+        combined = job_result(combined_job)
+        st.markdown(combined)
+        sections.insert(0, f"# Across All Documents\n\n{combined}")
+    return "\n\n".join(sections)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_pending_document_set(legal_ai, uploaded_files):
+    """Redraw the session's pending multi-document analysis every JOB_POLL_SECONDS without holding up the page
+    
+    Once the report is complete it moves to session state and the whole page reruns to show it.
+    """
+    pending_set = st.session_state.get("document_set_jobs")
+    if not pending_set:
+        return
+    file_names, analysis_type, jobs = pending_set
+    report = render_document_set(legal_ai, uploaded_files, analysis_type, DOCUMENT_SET_ANALYSES[analysis_type], jobs)
+    if report is not None:
+        st.session_state.document_set_report = (file_names, report)
+        del st.session_state.document_set_jobs
+        st.rerun()
+
+# Changed clauses shown in the diff; the rest are still sent to the model
+SIMILAR_MAX_DIFF_CHANGES = 200
+
+def render_similar(legal_ai, match, document_text):
+    """Offer the analyses of an earlier document from the same template, with what changed
+    
+    Returns the analysis type the user asked to update for the changes, or None.
+    """
+    changes = legal_ai.document_changes(match, document_text)
+    st.info(
+        f"🔁 This looks like **{match.name or 'a document'}**, analysed earlier "
+        f"({match.similarity:.0%} similar, {len(changes)} changed section(s))."
+    )
+    with st.expander("🔍 What changed"):
+        if changes:
+            st.code(format_diff(changes[:SIMILAR_MAX_DIFF_CHANGES]), language="diff")
+            if len(changes) > SIMILAR_MAX_DIFF_CHANGES:
+                st.caption(f"Showing the first {SIMILAR_MAX_DIFF_CHANGES} of {len(changes)} changes")
+        else:
+            st.caption("The wording is the same; only the layout differs.")
+    
+    # Past this, most of the document has changed and a fresh analysis is the better answer
+    updatable = sum(len(change.old) + len(change.new) for change in changes) <= legal_ai.summarizer.chunk_chars
+    update_request = None
+    for analysis_type, label in DOCUMENT_SET_ANALYSES.items():
+        prior = legal_ai.prior_analysis(match, analysis_type)
+        if prior is None:
+            continue
+        with st.expander(f"📄 Earlier {label.lower()} ({match.name or 'similar document'})"):
+            st.markdown(prior)
+            if updatable and st.button(
+                "♻️ Update it for the changes only", key=f"update_{analysis_type}",
+                help="Sends the model the earlier analysis and the changed sections instead of the whole document",
+            ):
+                update_request = analysis_type
+    return update_request
+
+def render_token_usage(legal_ai, document_text):
+    """Sidebar breakdown of token usage and model time for the current document"""
+    document_hash = legal_ai._document_hash(document_text)
+    totals = legal_ai.tokens.totals(document_hash)
+    with st.sidebar.expander("🧮 Token usage (this document)"):
+        st.markdown(
+            f"**{totals['calls']}** model calls · **{totals['prompt_tokens']:,}** prompt tokens · "
+            f"**{totals['completion_tokens']:,}** completion tokens · **{totals['seconds']:.1f}s** in the model"
+            + (f" · **{totals['cached_tokens']:,}** prompt tokens read from the context cache"
+               if totals['cached_tokens'] else "")
+        )
+        st.caption(f"Document is about {legal_ai.tokens.count(document_text):,} tokens; "
+                   f"per-request limit is {legal_ai.tokens.max_prompt_tokens:,}")
+        records = legal_ai.tokens.records(document_hash)
+        if records:
+            st.table([
+                {"Call": r.label, "Prompt": r.prompt_tokens, "Cached": r.cached_tokens,
+                 "Completion": r.completion_tokens, "Seconds": r.seconds}
+                for r in records[-20:]
+            ])
+
+def render_debug_timings(legal_ai, document_text, limit=5):
+    """Sidebar breakdown of the most recent traced requests for the current document, stage by stage"""
+    document_hash = legal_ai._document_hash(document_text)
+    traces = get_tracer().recent(document=document_hash)[:limit]
+    page_stats = legal_ai.page_stats.get(document_hash)
+    with st.sidebar.expander("🐞 Timing breakdown (this document)", expanded=True):
+        if page_stats:
+            # Pages PyPDF2 rescued or that read poorly, then the slowest, rather than every page
+            flagged = [s for s in page_stats if s.parser != "pymupdf" or s.quality < MIN_PAGE_QUALITY]
+            slowest = sorted(page_stats, key=lambda s: s.seconds, reverse=True)[:5]
+            shown = sorted(set(flagged[:15] + slowest), key=lambda s: s.page_number)
+            st.markdown(f"**Pages** · {len(page_stats)} extracted · {len(flagged)} flagged")
+            st.table([
+                {"Page": s.page_number, "Parser": s.parser, "ms": round(s.seconds * 1000, 1),
+                 "Chars": s.chars, "Quality": s.quality, "Error": s.error or ""}
+                for s in shown
+            ])
+        if not traces:
+            st.caption("No traced requests yet")
+        for root in traces:
+            st.markdown(f"**{root.name}** · {root.duration_ms:,.0f} ms" + (" · ❌" if root.error else ""))
+            st.table([
+                {
+                    "Stage": "\u2003" * depth + span.name,
+                    "ms": round(span.duration_ms, 1),
+                    "Details": ", ".join(f"{k}={v}" for k, v in span.attributes.items() if k != "document"),
+                }
+                for depth, span in root.walk()
+            ])
+
+def main(legal_ai_class=LegalDocumentAI):
+    # Load environment variables (here rather than on import, so importing app has no side effects)
+    load_dotenv()
+    
     st.set_page_config(
         page_title="Legal Document AI - Demystify Legal Jargon", 
         page_icon="💰",
@@ -233,7 +1029,7 @@ def main():
     
     # Initialize the AI system
     if 'legal_ai' not in st.session_state:
-        st.session_state.legal_ai = LegalDocumentAI()
+        st.session_state.legal_ai = legal_ai_class()
     
     # Sidebar for navigation
     st.sidebar.title("📋 How to Use")
@@ -259,66 +1055,144 @@ def main():
     - Any legal document with financial terms!
     """)
     
+    stream_responses = st.sidebar.checkbox(
+        "⚡ Stream responses", value=True, help="Show the answer as it is written instead of waiting for all of it"
+    )
+    
+    show_timings = st.sidebar.checkbox(
+        "🐞 Show timing breakdown", value=False, help="Per-stage timings, sizes and page counts for recent requests"
+    )
+    
+    cache_stats = get_response_cache().stats()
+    flight_stats = get_single_flight().stats()
+    st.sidebar.caption(
+        f"⚡ Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses · "
+        f"{flight_stats['shared']} duplicate model calls avoided"
+    )
+    
     # File upload
     st.header("📄 Upload Your Legal Document")
-    uploaded_file = st.file_uploader(
-        "Choose your legal document", 
+    uploaded_files = st.file_uploader(
+        "Choose your legal document(s)", 
         type=['pdf', 'docx', 'txt'],
-        help="Supports PDF, Word docs, and text files with readable text"
+        accept_multiple_files=True,
+        help="Supports PDF, Word docs, and text files with readable text. Upload several (e.g. a lease and its addenda) to review them together."
     )
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
+    # Documents the user has removed no longer count towards the session's memory limit
+    st.session_state.legal_ai.keep_uploads(f.name for f in uploaded_files)
     
-    if uploaded_file is not None:
+    if len(uploaded_files) > 1:
+        st.success(f"✅ Uploaded {len(uploaded_files)} documents: {', '.join(f.name for f in uploaded_files)}")
+        st.header("🤖 AI Financial Analysis")
+        choice = st.radio(
+            "Analysis for each document:", list(DOCUMENT_SET_ANALYSES), horizontal=True,
+            format_func=lambda analysis_type: DOCUMENT_SET_ANALYSES[analysis_type],
+        )
+        file_names = tuple(f.name for f in uploaded_files)
+        if st.button("📚 Analyze All Documents", use_container_width=True):
+            st.session_state.document_set_jobs = (file_names, choice, {})
+        # As with a single document, a rerun while the analyses run picks their jobs up from session state
+        pending_set = st.session_state.get("document_set_jobs")
+        if pending_set and pending_set[0] != file_names:
+            del st.session_state.document_set_jobs  # Submitted for uploads that have since changed
+            pending_set = None
+        if pending_set:
+            render_pending_document_set(st.session_state.legal_ai, uploaded_files)
+        elif st.session_state.get("document_set_report", (None,))[0] == file_names:
+            st.markdown(st.session_state.document_set_report[1])
+        
+        if st.session_state.get("document_set_report", (None,))[0] == file_names:
+            st.download_button(
+                label="📄 Download Combined Analysis",
+                data=st.session_state.document_set_report[1],
+                file_name="legal_analysis_documents.txt",
+                mime="text/plain"
+            )
+    
+    elif uploaded_file is not None:
         # Display file info
         st.success(f"✅ Uploaded: {uploaded_file.name}")
         
-        # Extract text
-        with st.spinner("📖 Reading and analyzing your document..."):
-            document_text = st.session_state.legal_ai.extract_text_from_file(uploaded_file)
+        # Extract text, previewing pages as they are parsed
+        document_text = render_extraction(st.session_state.legal_ai, uploaded_file)
         
         if document_text.strip():
             # Show document preview
             with st.expander("📖 Document Preview (Click to expand)"):
-                st.text_area("Document Content", document_text[:1500] + "..." if len(document_text) > 1500 else document_text, height=200)
+                render_preview(st.session_state.legal_ai, document_text)
+            
+            # An earlier upload from the same template: offer its analyses, updated for what changed
+            similar = st.session_state.legal_ai.find_similar(document_text)
+            update_request = render_similar(st.session_state.legal_ai, similar, document_text) if similar else None
             
             # Analysis options
             st.header("🤖 AI Financial Analysis")
             st.markdown("Choose the type of analysis that best fits your needs:")
             
             col1, col2, col3 = st.columns(3)
+            analysis_request = None
             
             with col1:
                 if st.button("💡 Get Simple Summary", use_container_width=True, help="Plain English explanation focusing on financial impact"):
-                    with st.spinner("🧠 AI is analyzing your document for financial implications..."):
-                        summary = st.session_state.legal_ai.simplify_legal_text(document_text, "summary")
-                    st.session_state.current_analysis = summary
-                    st.session_state.analysis_type = "Summary"
+                    analysis_request = ("summary", "Summary", "🧠 AI is analyzing your document for financial implications...")
             
             with col2:
                 if st.button("⚠️ Find Financial Risks", use_container_width=True, help="Identify potential costs, penalties, and financial dangers"):
-                    with st.spinner("🔍 Identifying financial risks and red flags..."):
-                        risks = st.session_state.legal_ai.simplify_legal_text(document_text, "risks")
-                    st.session_state.current_analysis = risks
-                    st.session_state.analysis_type = "Financial Risks"
+                    analysis_request = ("risks", "Financial Risks", "🔍 Identifying financial risks and red flags...")
             
             with col3:
                 if st.button("❓ Smart Questions to Ask", use_container_width=True, help="Get prepared questions to ask before signing"):
-                    with st.spinner("💡 Preparing smart questions to protect your interests..."):
-                        questions = st.session_state.legal_ai.simplify_legal_text(document_text, "questions")
-                    st.session_state.current_analysis = questions
-                    st.session_state.analysis_type = "Questions to Ask"
+                    analysis_request = ("questions", "Questions to Ask", "💡 Preparing smart questions to protect your interests...")
+            
+            if st.button("📑 Full Report (all three at once)", use_container_width=True, help="Run the summary, risks and questions together"):
+                analysis_request = ("full", "Full Report", "📑 Preparing your full report...")
+            
+            # The rule scan needs no model call, so its results can show before (or instead of) the AI's
+            with st.expander("⚡ Instant scan: fees, penalties and deadlines (no AI)",
+                             expanded=bool(analysis_request and analysis_request[0] in ("risks", "full"))):
+                render_prescan(st.session_state.legal_ai, document_text)
+            
+            # Analyses run as background jobs, so touching a widget while one runs doesn't lose it:
+            # the rerun finds the jobs in session state and its fragment carries on polling them
+            if analysis_request:
+                request_type, st.session_state.analysis_type, spinner_text = analysis_request
+                analysis_types = tuple(REPORT_SECTIONS) if request_type == "full" else (request_type,)
+                st.session_state.analysis_jobs = (spinner_text, {
+                    analysis_type: st.session_state.legal_ai.submit_analysis(
+                        document_text, analysis_type, name=uploaded_file.name
+                    )
+                    for analysis_type in analysis_types
+                })
+            elif update_request:
+                st.session_state.analysis_type = f"Updated {DOCUMENT_SET_ANALYSES[update_request]}"
+                st.session_state.analysis_jobs = ("♻️ Updating the earlier analysis for what changed...", {
+                    update_request: st.session_state.legal_ai.submit_update(similar, document_text, update_request)
+                })
+            pending_jobs = st.session_state.get("analysis_jobs")
+            document_hash = st.session_state.legal_ai._document_hash(document_text)
+            if pending_jobs and any(job.key[0] != document_hash for job in pending_jobs[1].values()):
+                # Submitted for a document that has since been replaced
+                del st.session_state.analysis_jobs
+                pending_jobs = None
             
             # Display analysis results
-            if 'current_analysis' in st.session_state:
+            if pending_jobs or 'current_analysis' in st.session_state:
                 st.header(f"📋 {st.session_state.get('analysis_type', 'Analysis')} Results")
-                st.markdown(st.session_state.current_analysis)
                 
-                # Add download button for the analysis
-                st.download_button(
-                    label="📄 Download Analysis",
-                    data=st.session_state.current_analysis,
-                    file_name=f"legal_analysis_{uploaded_file.name}.txt",
-                    mime="text/plain"
-                )
+                if pending_jobs:
+                    # Polled in a fragment, so the questions and panels below stay usable meanwhile
+                    render_pending_analysis(stream_responses)
+                else:
+                    st.markdown(st.session_state.current_analysis)
+                    
+                    # Add download button for the analysis
+                    st.download_button(
+                        label="📄 Download Analysis",
+                        data=st.session_state.current_analysis,
+                        file_name=f"legal_analysis_{uploaded_file.name}.txt",
+                        mime="text/plain"
+                    )
             
             # Q&A section
             st.header("💬 Ask Specific Questions")
@@ -341,11 +1215,25 @@ def main():
                                         placeholder="e.g., What happens if I break this contract? What are the cancellation fees?")
             
             if st.button("Get Answer") and user_question:
-                with st.spinner("🤔 Analyzing your specific question..."):
-                    answer = st.session_state.legal_ai.analyze_specific_clause(document_text, user_question)
-                
                 st.markdown("### 💡 Answer:")
-                st.markdown(answer)
+                if stream_responses:
+                    render_stream(
+                        st.session_state.legal_ai.stream_specific_clause(document_text, user_question),
+                        "🤔 Analyzing your specific question..."
+                    )
+                else:
+                    with st.spinner("🤔 Analyzing your specific question..."):
+                        answer = st.session_state.legal_ai.analyze_specific_clause(document_text, user_question)
+                    st.markdown(answer)
+                
+                with st.expander("📑 Where this comes from in the document"):
+                    for page, passage in st.session_state.legal_ai.highlighted_passages(document_text, user_question):
+                        st.caption(f"Page {page}" if page is not None else "Document")
+                        st.markdown(passage)
+            
+            render_token_usage(st.session_state.legal_ai, document_text)
+            if show_timings:
+                render_debug_timings(st.session_state.legal_ai, document_text)
         
         else:
             st.error("❌ Could not extract text from the document. Please ensure the file contains readable text or try a different file format.")
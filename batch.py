@@ -0,0 +1,266 @@
+"""Headless batch analysis of many legal documents.
+
+Examples:
+    python batch.py contracts/ --analyses summary,risks --output results.jsonl
+    python batch.py manifest.txt --format markdown --output reports/ --workers 8
+
+Re-running the same command resumes: each document runs only the
+analyses not already in the output, so a failed analysis is retried and
+adding one to --analyses leaves the others alone.
+"""
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from app import LegalDocumentAI
+from caching import content_hash
+from extraction import DOCX_TYPE, PDF_TYPE, TEXT_TYPE
+from prompts import ANALYSIS_PROMPTS
+from scheduler import BATCH, get_scheduler
+from summarizer import PAGE_MARKER
+
+FILE_TYPES = {".pdf": PDF_TYPE, ".docx": DOCX_TYPE, ".txt": TEXT_TYPE}
+# Precedes each analysis in a Markdown report, so a resumed run can tell which ones it holds
+MARKDOWN_ANALYSIS = re.compile(r"^<!-- analysis: (\w+) -->$", re.MULTILINE)
+
+
+class LocalFile(io.BytesIO):
+    """A file on disk that looks like a Streamlit UploadedFile to LegalDocumentAI"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(path)
+        self.type = FILE_TYPES[os.path.splitext(path)[1].lower()]
+
+
+def source_root(source):
+    """The directory document paths are relative to: the source directory, or the manifest's directory"""
+    return os.path.abspath(source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source)))
+
+
+def find_documents(source):
+    """List supported files under a directory, or the paths named in a manifest file"""
+    if os.path.isdir(source):
+        paths = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names
+        ]
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+        paths = [os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+
+    return sorted(p for p in paths if os.path.splitext(p)[1].lower() in FILE_TYPES)
+
+
+class ResultWriter:
+    """Append results as JSONL or one Markdown file per document, and report which analyses are already done
+
+    Markdown reports mirror the documents' paths under root, so files with the same name in different
+    folders get reports of their own.
+    """
+
+    def __init__(self, output, output_format, root):
+        self.output = output
+        self.output_format = output_format
+        self.root = root
+        self._lock = threading.Lock()
+        if output_format == "markdown":
+            os.makedirs(output, exist_ok=True)
+
+    def _markdown_path(self, path):
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        if relative.startswith(os.pardir + os.sep):
+            # Outside root (a manifest entry such as ../other/lease.pdf): a hash of the path keeps it apart
+            relative = f"{content_hash(os.path.abspath(path).encode('utf-8'))[:12]}-{os.path.basename(path)}"
+        return os.path.join(self.output, relative + ".md")
+
+    def _read_markdown(self, path):
+        """Analyses already in a document's Markdown report, by type"""
+        try:
+            with open(self._markdown_path(path), encoding="utf-8") as f:
+                parts = MARKDOWN_ANALYSIS.split(f.read())
+        except FileNotFoundError:
+            return {}
+        # parts is [title, type, section, type, section, ...]; each section is its heading then the result
+        return {
+            analysis_type: section.lstrip("\n").split("\n\n", 1)[-1].rstrip("\n")
+            for analysis_type, section in zip(parts[1::2], parts[2::2])
+        }
+
+    def completed(self):
+        """{path: analysis types done} from the JSONL output (None for Markdown, checked per document)"""
+        if self.output_format == "markdown":
+            return None
+        done = {}
+        if os.path.exists(self.output):
+            with open(self.output, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by an interrupted run
+                    done.setdefault(record["path"], set()).update(record.get("analyses", ()))
+        return done
+
+    def missing(self, path, analysis_types, completed):
+        """The analysis types still to run for path"""
+        if self.output_format == "markdown":
+            done = self._read_markdown(path)
+        else:
+            done = completed.get(path, ())
+        return [analysis_type for analysis_type in analysis_types if analysis_type not in done]
+
+    def write(self, record):
+        with self._lock:
+            if self.output_format == "markdown":
+                if not record["analyses"]:
+                    return  # Nothing new; the next run retries what failed
+                # Keep the analyses from earlier runs alongside the ones this run added
+                analyses = {**self._read_markdown(record["path"]), **record["analyses"]}
+                sections = [f"# {os.path.basename(record['path'])}\n"]
+                for analysis_type, result in analyses.items():
+                    sections.append(f"<!-- analysis: {analysis_type} -->\n## {analysis_type.title()}\n\n{result}\n")
+                markdown_path = self._markdown_path(record["path"])
+                os.makedirs(os.path.dirname(markdown_path), exist_ok=True)
+                with open(markdown_path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(sections))
+            else:
+                with open(self.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    f.flush()
+
+
+def analyze_document(legal_ai, path, analysis_types):
+    """Extract one document and run each analysis on it, returning a result record"""
+    started = time.perf_counter()
+    uploaded_file = LocalFile(path)
+    text = legal_ai.extract_text_from_file(uploaded_file)
+    legal_ai.release_uploads([uploaded_file.name])  # Only documents still being read count towards the limit
+
+    record = {
+        "path": path,
+        "sha256": content_hash(uploaded_file.getvalue()),
+        "pages": len(PAGE_MARKER.findall(text)) or None,  # Unknown for DOCX and text files, which have no page markers
+        "chars": len(text),
+        "analyses": {},
+        "errors": [],
+    }
+    if not text:
+        record["errors"].append("no text extracted")
+    else:
+        for analysis_type in analysis_types:
+            result = legal_ai.simplify_legal_text(text, analysis_type)
+            if result.startswith("Error analyzing document:"):
+                record["errors"].append(f"{analysis_type}: {result}")
+            else:
+                record["analyses"][analysis_type] = result
+
+    if text:
+        record["tokens"] = legal_ai.tokens.totals(legal_ai._document_hash(text))
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a directory or manifest of legal documents")
+    parser.add_argument("source", help="directory to scan, or a manifest file with one path per line")
+    parser.add_argument(
+        "--analyses", default="summary",
+        help=f"comma-separated analysis types from: {', '.join(ANALYSIS_PROMPTS)} (default: summary)",
+    )
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file, or directory for --format markdown")
+    parser.add_argument("--format", choices=("jsonl", "markdown"), default="jsonl", dest="output_format")
+    parser.add_argument("--workers", type=int, default=4, help="documents processed concurrently (default: 4)")
+    args = parser.parse_args(argv)
+
+    args.analyses = [name.strip() for name in args.analyses.split(",") if name.strip()]
+    unknown = [name for name in args.analyses if name not in ANALYSIS_PROMPTS]
+    if unknown:
+        parser.error(f"unknown analysis type(s): {', '.join(unknown)}")
+    return args
+
+
+def rates(docs, pages, chars, elapsed):
+    """Throughput so far; pages count PDF pages only, so characters/s covers DOCX and text files too"""
+    return f"{docs / elapsed:.2f} docs/s, {pages / elapsed:.1f} pages/s, {chars / elapsed:,.0f} chars/s"
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    load_dotenv()  # Same .env as the app; app.main loads it for the Streamlit UI
+    legal_ai = LegalDocumentAI()
+    try:
+        legal_ai.model  # Connect up front rather than failing on every document
+    except RuntimeError:
+        print("Could not connect to AI services; check service-account-key.json", file=sys.stderr)
+        return 1
+    legal_ai.priority = BATCH  # Interactive sessions sharing this process go first
+
+    writer = ResultWriter(args.output, args.output_format, source_root(args.source))
+    completed = writer.completed()
+    documents = find_documents(args.source)
+    pending = {}
+    for path in documents:
+        missing = writer.missing(path, args.analyses, completed)
+        if missing:
+            pending[path] = missing
+    print(f"{len(documents)} documents found, {len(documents) - len(pending)} already done, {len(pending)} to process", file=sys.stderr)
+
+    started = time.perf_counter()
+    finished_docs = finished_pages = finished_chars = failures = 0
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = {
+            executor.submit(analyze_document, legal_ai, path, analysis_types): path
+            for path, analysis_types in pending.items()
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {"path": path, "analyses": {}, "errors": [str(e)], "pages": None, "chars": 0}
+            writer.write(record)
+
+            finished_docs += 1
+            finished_pages += record["pages"] or 0
+            finished_chars += record["chars"]
+            failures += bool(record["errors"])
+            elapsed = time.perf_counter() - started
+            print(
+                f"[{finished_docs}/{len(pending)}] {path} "
+                f"{'FAILED' if record['errors'] else 'ok'} "
+                f"({rates(finished_docs, finished_pages, finished_chars, elapsed)})",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        print("Interrupted; re-run the same command to resume", file=sys.stderr)
+        return 130
+    executor.shutdown()
+
+    elapsed = time.perf_counter() - started
+    if finished_docs:
+        print(
+            f"Done: {finished_docs} documents, {finished_pages} PDF pages, {finished_chars:,} characters "
+            f"in {elapsed:.1f}s ({rates(finished_docs, finished_pages, finished_chars, elapsed)}), {failures} failed",
+            file=sys.stderr,
+        )
+        print(f"Model calls: {get_scheduler().stats()}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""DOCX extraction benchmark: python-docx's object model against the streaming iterparse reader.
+
+Generates synthetic agreements with a fee-schedule table every few pages and
+a header and footer, then extracts each with both readers in fresh
+interpreters, reporting the median time, peak memory and how much text each
+one recovers (python-docx's paragraphs skip tables, headers and footers).
+
+    python benchmarks/docx_extraction.py --pages 100,1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pipeline import peak_rss_mb, ROOT, synthetic_pages
+
+READERS = ("python-docx", "iterparse")
+TABLE_EVERY_PAGES = 5
+
+
+def write_agreement(path, page_count):
+    import docx
+
+    document = docx.Document()
+    document.sections[0].header.paragraphs[0].text = "Master Services Agreement - Confidential"
+    document.sections[0].footer.paragraphs[0].text = "Initials: ______  ______"
+    for page_number, page_text in enumerate(synthetic_pages(page_count), 1):
+        for line in page_text.split("\n"):
+            document.add_paragraph(line)
+        if page_number % TABLE_EVERY_PAGES == 0:
+            table = document.add_table(rows=1, cols=3)
+            for cell, title in zip(table.rows[0].cells, ("Fee", "Amount", "When charged")):
+                cell.text = title
+            for fee, amount, when in (
+                ("Late payment", f"${page_number * 3:,}", "After 10 days"),
+                ("Early termination", f"${page_number * 40:,}", "On notice"),
+                ("Admin", f"${page_number:,}", "Monthly"),
+            ):
+                cells = table.add_row().cells
+                cells[0].text, cells[1].text, cells[2].text = fee, amount, when
+        document.add_page_break()
+    document.save(path)
+
+
+def run_case(reader, path):
+    """Extract one document with one reader in this (fresh) process and return its metrics"""
+    sys.path.insert(0, ROOT)
+    import docx  # Loaded up front for both readers, so neither pays for it in the timing
+    from extraction import DOCX_TYPE, format_pages, iter_document_pages
+
+    with open(path, "rb") as f:
+        data = f.read()
+    baseline_rss = peak_rss_mb()
+    started = time.perf_counter()
+    if reader == "python-docx":
+        import io
+
+        text = "\n".join(paragraph.text for paragraph in docx.Document(io.BytesIO(data)).paragraphs)
+    else:
+        text = format_pages(iter_document_pages(data, DOCX_TYPE))
+    seconds = time.perf_counter() - started
+    return {
+        "seconds": seconds,
+        "peak_rss_growth_mb": peak_rss_mb() - baseline_rss,
+        "chars": len(text),
+        "fee_rows": text.count("Early termination |"),
+    }
+
+
+def measure(reader, path, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--case", reader, path],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default="100,1000", help="comma-separated document sizes in pages")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "docsummarizer-bench"),
+                        help="where generated documents are kept and reused")
+    parser.add_argument("--case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(*args.case)))
+        return 0
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    print(f"{'case':<12}{'reader':>14}{'seconds':>10}{'peak MB':>10}{'chars':>12}{'fee rows':>10}")
+    for page_count in (int(size) for size in args.pages.split(",")):
+        path = os.path.join(args.data_dir, f"agreement_{page_count}p.docx")
+        if not os.path.exists(path):
+            write_agreement(path, page_count)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        for reader in READERS:
+            result = measure(reader, path, args.repeat)
+            print(
+                f"{f'{page_count}p {size_mb:.1f}MB':<12}{reader:>14}{result['seconds']:>10.2f}"
+                f"{result['peak_rss_growth_mb']:>10.0f}{result['chars']:>12,.0f}{result['fee_rows']:>10.0f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""Offline end-to-end benchmark: extraction, analysis latency, memory and caching.
+
+Generates synthetic legal documents (PDF, DOCX and TXT) of increasing size and
+runs each through the app with the fake model backend, so no Google Cloud
+access is needed. Every case runs in a fresh interpreter with fixed settings,
+and results can be saved and compared between commits.
+
+    python benchmarks/pipeline.py --pages 10,100,1000 --output before.json
+    python benchmarks/pipeline.py --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FORMATS = ("pdf", "docx", "txt")
+CHARS_PER_PAGE = 2500
+SEED = 1234
+
+# Pinned so runs on different commits and machines measure the same work
+CASE_ENV = {
+    "MODEL_BACKEND": "fake",
+    "FAKE_MODEL_LATENCY": "0.05",
+    "FAKE_MODEL_TOKENS_PER_SECOND": "500",
+    "FAKE_MODEL_RESPONSE_WORDS": "120",
+    "MODEL_REQUESTS_PER_MINUTE": "1000000",
+    "MODEL_TOKENS_PER_MINUTE": "1000000000",
+    "RESPONSE_CACHE_BACKEND": "memory",
+    "EXTRACTION_CACHE_DIR": "",
+    "TRACE_EXPORT": "",
+}
+
+CLAUSES = [
+    "The {party} shall pay {amount} on the first day of each month, and a late fee of {fee} applies to any payment received more than {days} days after it is due.",
+    "Either party may terminate this Agreement with {days} days' written notice; early termination by the {party} incurs a charge of {fee}.",
+    "A security deposit of {amount} is payable on signing and will be returned within {days} days of the end of the term, less any amounts owed.",
+    "The {party} is responsible for all repairs costing less than {fee} and shall indemnify the other party against any resulting claims.",
+    "This Agreement renews automatically for successive {days}-month terms unless either party gives notice of non-renewal.",
+    "Interest accrues on overdue amounts at {rate}% per annum, compounded monthly, until paid in full.",
+    "The {party} shall maintain insurance with a limit of not less than {amount} and provide evidence of cover on request.",
+    "Any dispute arising under this Agreement shall be resolved by binding arbitration, with costs borne by the {party}.",
+]
+
+
+def synthetic_pages(page_count, seed=SEED):
+    """Deterministic pseudo-legal text, about CHARS_PER_PAGE characters per page"""
+    rng = random.Random(seed)
+    pages = []
+    section = 1
+    for _ in range(page_count):
+        lines = []
+        while sum(map(len, lines)) < CHARS_PER_PAGE:
+            clause = rng.choice(CLAUSES).format(
+                party=rng.choice(["Tenant", "Landlord", "Borrower", "Lender", "Customer"]),
+                amount=f"${rng.randrange(500, 50000):,}",
+                fee=f"${rng.randrange(25, 2500):,}",
+                days=rng.choice([5, 10, 14, 30, 60, 90]),
+                rate=rng.choice([4.5, 8, 12.9, 18, 24.99]),
+            )
+            lines.append(f"{section}. {clause}")
+            section += 1
+        pages.append("\n".join(lines))
+    return pages
+
+
+def write_document(path, file_format, pages):
+    if file_format == "pdf":
+        import fitz  # PyMuPDF
+
+        with fitz.open() as pdf_document:
+            for page_text in pages:
+                page = pdf_document.new_page()
+                page.insert_textbox(page.rect + (50, 50, -50, -50), page_text, fontsize=8)
+            pdf_document.save(path)
+    elif file_format == "docx":
+        import docx
+
+        document = docx.Document()
+        for page_number, page_text in enumerate(pages):
+            if page_number:
+                document.add_page_break()
+            for line in page_text.split("\n"):
+                document.add_paragraph(line)
+        document.save(path)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(pages))
+
+
+def generate_documents(data_dir, sizes):
+    """Write (or reuse) one document per format and size, returning {(format, pages): path}"""
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for page_count in sizes:
+        pages = synthetic_pages(page_count)
+        for file_format in FORMATS:
+            path = os.path.join(data_dir, f"synthetic_{page_count}p.{file_format}")
+            if not os.path.exists(path):
+                write_document(path, file_format, pages)
+            paths[file_format, page_count] = path
+    return paths
+
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(path):
+    """Measure one document in this (fresh) process and return its metrics"""
+    sys.path.insert(0, ROOT)
+    from app import LegalDocumentAI
+    from batch import LocalFile
+    from caching import get_response_cache
+
+    legal_ai = LegalDocumentAI()
+    baseline_rss = peak_rss_mb()
+
+    def timed(fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - started
+
+    text, extract_seconds = timed(legal_ai.extract_text_from_file, LocalFile(path))
+    extract_rss = peak_rss_mb()
+    _, extract_warm_seconds = timed(legal_ai.extract_text_from_file, LocalFile(path))
+
+    _, summary_seconds = timed(legal_ai.simplify_legal_text, text, "summary")
+    _, summary_warm_seconds = timed(legal_ai.simplify_legal_text, text, "summary")
+    _, question_seconds = timed(legal_ai.analyze_specific_clause, text, "What are the late fees?")
+
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    cache_stats = get_response_cache().stats()
+    return {
+        "bytes": os.path.getsize(path),
+        "chars": len(text),
+        "extract_seconds": extract_seconds,
+        "extract_mb_per_second": size_mb / extract_seconds,
+        "extract_warm_seconds": extract_warm_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "extract_rss_growth_mb": extract_rss - baseline_rss,
+        "summary_seconds": summary_seconds,
+        "summary_warm_seconds": summary_warm_seconds,
+        "question_seconds": question_seconds,
+        "model_calls": legal_ai.model.calls,
+        "response_cache_hit_rate": cache_stats["hit_rate"],
+    }
+
+
+def measure(path, pages, repeat):
+    """Run a case `repeat` times in fresh interpreters and keep the median of each metric"""
+    env = {**os.environ, **CASE_ENV}
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--case", path],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    result["pages"] = pages
+    result["pages_per_second"] = pages / result["extract_seconds"]
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    baseline_cases = {(r["format"], r["pages"]): r for r in (baseline or {}).get("results", [])}
+    columns = [
+        ("pages_per_second", "pages/s", "{:.0f}"),
+        ("extract_mb_per_second", "MB/s", "{:.1f}"),
+        ("extract_warm_seconds", "warm s", "{:.4f}"),
+        ("peak_rss_mb", "peak MB", "{:.0f}"),
+        ("summary_seconds", "summary s", "{:.2f}"),
+        ("summary_warm_seconds", "cached s", "{:.4f}"),
+        ("question_seconds", "question s", "{:.2f}"),
+        ("model_calls", "calls", "{:.0f}"),
+        ("response_cache_hit_rate", "hit rate", "{:.2f}"),
+    ]
+    print(f"{'case':<12}" + "".join(f"{title:>16}" for _, title, _ in columns))
+    for result in results:
+        previous = baseline_cases.get((result["format"], result["pages"]))
+        cells = []
+        for key, _, fmt in columns:
+            cell = fmt.format(result[key])
+            if previous and previous.get(key):
+                change = (result[key] - previous[key]) / previous[key] * 100
+                cell += f" ({change:+.0f}%)"
+            cells.append(f"{cell:>16}")
+        print(f"{result['format'] + ' ' + str(result['pages']) + 'p':<12}" + "".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default="10,100,1000", help="comma-separated document sizes in pages")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="comma-separated formats to run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "docsummarizer-bench"),
+                        help="where generated documents are kept and reused")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results from an earlier run to show changes against")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(args.case)))
+        return 0
+
+    sizes = [int(size) for size in args.pages.split(",")]
+    formats = [name.strip() for name in args.formats.split(",") if name.strip()]
+    paths = generate_documents(args.data_dir, sizes)
+
+    results = []
+    for page_count in sizes:
+        for file_format in formats:
+            print(f"Running {file_format} {page_count} pages...", file=sys.stderr)
+            result = measure(paths[file_format, page_count], page_count, args.repeat)
+            results.append({"format": file_format, **result})
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with {baseline.get('commit') or args.compare} (+/- % change):")
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": CASE_ENV,
+            "repeat": args.repeat,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
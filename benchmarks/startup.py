@@ -0,0 +1,75 @@
+"""Cold-start benchmark for the Streamlit app module.
+
+Imports the app in fresh interpreters, reports the median import time, and
+fails if it exceeds the budget or if a heavy SDK/parser is loaded eagerly.
+
+    python benchmarks/startup.py --app app1 --runs 5 --budget 2.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only load when a document of that type or a model call needs them
+LAZY_MODULES = [
+    "fitz",
+    "PyPDF2",
+    "docx",
+    "numpy",
+    "google.generativeai",
+    "google.cloud.aiplatform",
+    "google.oauth2.service_account",
+]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {app}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "eager": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(app, runs):
+    import json
+
+    timings = []
+    eager = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(app=app, lazy=LAZY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        eager.update(result["eager"])
+    return timings, sorted(eager)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default="app", help="module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", 2.0)),
+                        help="maximum median import time in seconds")
+    args = parser.parse_args(argv)
+
+    timings, eager = measure(args.app, args.runs)
+    median = statistics.median(timings)
+    print(f"import {args.app}: median {median:.3f}s, min {min(timings):.3f}s, max {max(timings):.3f}s over {args.runs} runs")
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported eagerly at start-up: {', '.join(eager)}")
+        failed = True
+    if median > args.budget:
+        print(f"FAIL: median import time {median:.3f}s exceeds budget {args.budget:.3f}s")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
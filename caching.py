@@ -0,0 +1,441 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Bump whenever extract_text_from_file changes its output so stale entries are ignored
+EXTRACTOR_VERSION = "5"
+
+
+def content_hash(data):
+    """Return a stable hex digest for raw file bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache bounded by the total size of its values"""
+
+    def __init__(self, max_size, sizeof=len):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._items = OrderedDict()
+        self._building = {}  # key -> Event set when the get_or_create building it finishes
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def get_or_create(self, key, build):
+        """The value for key, calling build() to make and cache it if absent; concurrent callers share one build"""
+        while True:
+            with self._lock:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    return self._items[key]
+                building = self._building.get(key)
+                if building is None:
+                    building = self._building[key] = threading.Event()
+                    break
+            building.wait()  # Then look again: the build may have failed or not fit, leaving it to this caller
+
+        try:
+            value = build()
+            self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._building[key]
+            building.set()
+
+    def set(self, key, value):
+        item_size = self.sizeof(value)
+        if item_size > self.max_size:
+            return
+        with self._lock:
+            if key in self._items:
+                self.size -= self.sizeof(self._items.pop(key))
+            self._items[key] = value
+            self.size += item_size
+            while self.size > self.max_size:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            value = self._items.pop(key)
+            self.size -= self.sizeof(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class CountedLRUCache(LRUCache):
+    """LRUCache bounded by the number of entries, for values whose size isn't worth measuring"""
+
+    def __init__(self, max_entries):
+        super().__init__(max_entries, sizeof=lambda value: 1)
+
+
+class DiskCache:
+    """Directory of UTF-8 text files bounded by total bytes, evicting least recently used"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = f.read()
+            os.utime(path)  # Touch so eviction treats it as recently used
+            return value
+        except OSError:
+            return default
+
+    def set(self, key, value):
+        data = value.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".txt"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+class ExtractionCache:
+    """Two-tier cache of extracted document text keyed by content hash
+
+    With compress on, the memory tier holds zlib-compressed UTF-8, so the same
+    budget keeps several times more documents resident.
+    """
+
+    def __init__(self, memory_bytes=64 * 1024 * 1024, disk_dir=None, disk_bytes=512 * 1024 * 1024, compress=True):
+        self.memory = LRUCache(memory_bytes)
+        self.disk = DiskCache(disk_dir, disk_bytes) if disk_dir else None
+        self.compress = compress
+
+    def _pack(self, text):
+        return zlib.compress(text.encode("utf-8"), 1) if self.compress else text
+
+    def _unpack(self, value):
+        return zlib.decompress(value).decode("utf-8") if isinstance(value, bytes) else value
+
+    @staticmethod
+    def make_key(file_bytes, file_type):
+        """Key on file content (bytes or a buffer), declared type and extractor version"""
+        type_tag = hashlib.sha256(file_type.encode("utf-8")).hexdigest()[:8]
+        return f"{content_hash(file_bytes)}-{type_tag}-v{EXTRACTOR_VERSION}"
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return self._unpack(value)
+        if self.disk is None:
+            return None
+        text = self.disk.get(key)
+        if text is not None:
+            self.memory.set(key, self._pack(text))
+        return text
+
+    def set(self, key, text):
+        self.memory.set(key, self._pack(text))
+        if self.disk is not None:
+            try:
+                self.disk.set(key, text)
+            except OSError:
+                pass  # The disk tier is best-effort; the memory tier still holds it
+
+
+_extraction_cache = None
+_extraction_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """Process-wide extraction cache shared by every Streamlit session"""
+    global _extraction_cache
+    with _extraction_cache_lock:
+        if _extraction_cache is None:
+            _extraction_cache = ExtractionCache(
+                memory_bytes=int(os.getenv("EXTRACTION_CACHE_MEMORY_BYTES", 64 * 1024 * 1024)),
+                disk_dir=os.getenv("EXTRACTION_CACHE_DIR") or None,
+                disk_bytes=int(os.getenv("EXTRACTION_CACHE_DISK_BYTES", 512 * 1024 * 1024)),
+                compress=os.getenv("EXTRACTION_CACHE_COMPRESS", "1") != "0",
+            )
+        return _extraction_cache
+
+
+class MemoryBackend:
+    """In-process LRU response store bounded by entry count"""
+
+    def __init__(self, max_entries=1000):
+        self._cache = CountedLRUCache(max_entries)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, entry):
+        self._cache.set(key, entry)
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+
+class SQLiteBackend:
+    """Response store in a local SQLite file, evicting least recently used rows past max_entries"""
+
+    def __init__(self, path, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+            return row
+
+    def set(self, key, entry):
+        expires_at, value = entry
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+
+class RedisBackend:
+    """Response store on a Redis-compatible server; size is bounded by the server's maxmemory policy"""
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="docsummarizer:"):
+        import redis  # Optional dependency, only needed for this backend
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        if value is None:
+            return None
+        return None, value.decode("utf-8")  # Redis expires keys itself
+
+    def set(self, key, entry):
+        expires_at, value = entry
+        ttl = max(1, int(expires_at - time.time())) if expires_at else None
+        self._client.set(self.prefix + key, value.encode("utf-8"), ex=ttl)
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+
+class ResponseCache:
+    """Model response cache with TTL and hit/miss counters over a pluggable backend"""
+
+    def __init__(self, backend, ttl=7 * 24 * 3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()  # Sessions and job workers serve requests concurrently
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash key parts such as (document hash, analysis type, prompt version, model)"""
+        return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        value = self.peek(key)
+        with self._stats_lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def peek(self, key):
+        """Like get, without counting towards the hit rate (for looking, rather than serving a request)"""
+        entry = self.backend.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > time.time():
+                return value
+            self.backend.delete(key)
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self.backend.set(key, (expires_at, value))
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide response cache; backend chosen by RESPONSE_CACHE_BACKEND (memory, sqlite or redis)"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            backend_name = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+            max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+            if backend_name == "sqlite":
+                backend = SQLiteBackend(
+                    os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite3"), max_entries
+                )
+            elif backend_name == "redis":
+                backend = RedisBackend(os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0"))
+            else:
+                backend = MemoryBackend(max_entries)
+            _response_cache = ResponseCache(
+                backend, ttl=int(os.getenv("RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+            )
+        return _response_cache
+
+
+class FlightAbandoned(RuntimeError):
+    """The caller running a shared call stopped before it finished (e.g. a closed response stream)"""
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one: the first caller runs it, the rest wait for its result
+
+    Unlike the response cache, nothing is kept once a call finishes; this only covers the window while
+    the response cache is still empty, when several sessions would otherwise all call the model.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """(future, leader): the leader must run the call and end it with finish(); others wait on future"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def finish(self, key, result=None, error=None):
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """(result, shared): fn()'s result, computed here or by the call already in flight for key"""
+        while True:
+            future, leader = self.begin(key)
+            if leader:
+                break
+            try:
+                return future.result(), True
+            except FlightAbandoned:
+                continue  # Its leader went away before finishing; run it here instead
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight():
+    """Process-wide, so identical requests from different sessions share one model call"""
+    return _single_flight
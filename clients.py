@@ -0,0 +1,289 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from tokens import heuristic_token_count
+
+logger = logging.getLogger(__name__)
+
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+
+class ClientRegistry:
+    """Thread-safe, process-wide store of credentials and model clients shared by every session
+
+    Each key has its own lock, so a slow connection for one client doesn't block lookups of another.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """Return the item for key, creating it with factory() on first use
+
+        A factory that returns None (e.g. credentials are missing) is not cached, so the next call retries.
+        """
+        item = self._items.get(key)
+        if item is not None:
+            return item
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            item = self._items.get(key)
+            if item is None:
+                item = factory()
+                if item is not None:
+                    self._items[key] = item
+            return item
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_registry = ClientRegistry()
+
+
+def get_shared_client(key, factory):
+    return _registry.get(key, factory)
+
+
+def load_service_account_credentials(path=None, info=None):
+    """Scoped service-account credentials, loaded once per process for each key file or key dict"""
+    from google.oauth2 import service_account
+
+    # Explicit scopes mean API clients use this object as-is rather than a scoped copy,
+    # so every client shares the one cached access token
+    if path is not None:
+        return get_shared_client(
+            ("credentials", os.path.abspath(path)),
+            lambda: service_account.Credentials.from_service_account_file(path, scopes=[CLOUD_PLATFORM_SCOPE]),
+        )
+    return get_shared_client(
+        ("credentials", info.get("client_email"), info.get("private_key_id")),
+        lambda: service_account.Credentials.from_service_account_info(info, scopes=[CLOUD_PLATFORM_SCOPE]),
+    )
+
+
+_refresh_lock = threading.Lock()
+_auth_request = None
+
+
+def ensure_fresh(credentials):
+    """Refresh the shared token once, under a lock, when it is missing or close to expiry"""
+    global _auth_request
+    if credentials.valid:
+        return
+    with _refresh_lock:
+        if credentials.valid:
+            return  # Another thread refreshed it while we waited
+        if _auth_request is None:
+            import requests
+            from google.auth.transport.requests import Request
+
+            # One keep-alive session for every token refresh in the process
+            _auth_request = Request(session=requests.Session())
+        credentials.refresh(_auth_request)
+
+
+class ModelClient:
+    """A shared Gemini model together with the credentials it authenticates with"""
+
+    def __init__(self, model, credentials=None):
+        self.model = model
+        self.credentials = credentials
+
+    def generate_content(self, *args, **kwargs):
+        if self.credentials is not None:
+            ensure_fresh(self.credentials)
+        return self.model.generate_content(*args, **kwargs)
+
+    def cache_context(self, contents, ttl_seconds, model_name=None):
+        """A client for this model with contents held server-side in Gemini's context cache
+
+        Calls through the returned client send only their own prompt; the cached contents are read from
+        the cache. model_name overrides the model to cache for (context caching needs a versioned name).
+        """
+        import datetime
+
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        if self.credentials is not None:
+            ensure_fresh(self.credentials)
+        cached_content = caching.CachedContent.create(
+            model=model_name or self.model.model_name,
+            contents=[contents],
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        return ModelClient(genai.GenerativeModel.from_cached_content(cached_content=cached_content), self.credentials)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class ContextCache:
+    """Process-wide cached model contexts (e.g. a document sent once and referenced by later calls), with expiry
+
+    Each key has its own lock, so concurrent sessions create a context once. A context that fails to
+    create (the model doesn't support it, the contents are too short) is remembered as unavailable for
+    the same period, so later calls fall back at once instead of retrying it each time.
+    """
+
+    def __init__(self, ttl_seconds=3600, renew_margin_seconds=60):
+        self.ttl_seconds = ttl_seconds
+        self.renew_margin_seconds = renew_margin_seconds
+        self.created = 0
+        self.failed = 0
+        self._items = {}  # key -> (context or None, expires_at)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """The context for key, creating it with factory(ttl_seconds) if missing or about to expire (None if unavailable)"""
+        entry = self._items.get(key)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[1] > time.time():
+                return entry[0]
+            try:
+                context = factory(self.ttl_seconds)
+            except Exception as e:
+                # Calls still work without the context, so note why they'll resend the contents instead
+                logger.warning(json.dumps({
+                    "event": "context_cache_failed",
+                    "key": [str(part) for part in key] if isinstance(key, tuple) else str(key),
+                    "error": f"{type(e).__name__}: {e}",
+                    "retry_after_seconds": max(0, self.ttl_seconds - self.renew_margin_seconds),
+                }))
+                context = None
+            expires_at = time.time() + max(0, self.ttl_seconds - self.renew_margin_seconds)
+            with self._lock:
+                if context is None:
+                    self.failed += 1
+                else:
+                    self.created += 1
+                # Drop expired contexts while here, so the store doesn't grow with every document
+                for expired in [k for k, (_, expires) in self._items.items() if expires <= time.time()]:
+                    del self._items[expired]
+                    self._key_locks.pop(expired, None)
+                self._items[key] = (context, expires_at)
+            return context
+
+    def stats(self):
+        with self._lock:
+            return {"contexts": len(self._items), "created": self.created, "failed": self.failed}
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache():
+    """Process-wide, so every session asking about the same document shares its cached context"""
+    global _context_cache
+    with _context_cache_lock:
+        if _context_cache is None:
+            _context_cache = ContextCache(ttl_seconds=int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", 3600)))
+        return _context_cache
+
+
+FAKE_RESPONSE = (
+    "This agreement commits you to regular payments, with late fees if a payment is missed. "
+    "Either party may end it with written notice, but ending it early can cost you a termination fee. "
+    "Check the renewal terms, any deposit you pay up front, and who covers repair and legal costs. "
+)
+
+# Like the API's usage, prompt_token_count includes any tokens read from a cached context
+FakeUsage = namedtuple("FakeUsage", "prompt_token_count candidates_token_count cached_content_token_count", defaults=(0,))
+FakeResponse = namedtuple("FakeResponse", "text usage_metadata")
+
+
+class FakeModel:
+    """Offline stand-in for the Gemini model: canned text after a fixed, configurable delay
+
+    Each call waits latency seconds before the first token plus one second per
+    tokens_per_second completion tokens, so timings are reproducible from run to run.
+    With prompt_tokens_per_second, reading the prompt takes time too, except for the
+    part held in a context from cache_context, which stands in for Gemini's context caching.
+    """
+
+    model_name = "fake"
+
+    def __init__(self, latency=0.05, tokens_per_second=500.0, response_words=120, stream_chunks=8,
+                 prompt_tokens_per_second=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.response_words = response_words
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+        self.cached_contexts = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        prompt_tokens_per_second = os.getenv("FAKE_MODEL_PROMPT_TOKENS_PER_SECOND")
+        return cls(
+            latency=float(os.getenv("FAKE_MODEL_LATENCY", 0.05)),
+            tokens_per_second=float(os.getenv("FAKE_MODEL_TOKENS_PER_SECOND", 500)),
+            response_words=int(os.getenv("FAKE_MODEL_RESPONSE_WORDS", 120)),
+            prompt_tokens_per_second=float(prompt_tokens_per_second) if prompt_tokens_per_second else None,
+        )
+
+    def cache_context(self, contents, ttl_seconds, model_name=None):
+        """A view of this model with contents treated as already read, like ModelClient.cache_context"""
+        cached_tokens = heuristic_token_count(contents)
+        with self._lock:
+            self.cached_contexts += 1
+        if self.prompt_tokens_per_second:
+            time.sleep(cached_tokens / self.prompt_tokens_per_second)  # Creating the cache reads it once
+        return FakeCachedContext(self, cached_tokens)
+
+    def _response_text(self):
+        words = FAKE_RESPONSE.split()
+        return " ".join(words[i % len(words)] for i in range(self.response_words))
+
+    def generate_content(self, prompt, stream=False, cached_tokens=0, **kwargs):
+        with self._lock:
+            self.calls += 1
+        text = self._response_text()
+        prompt_tokens = heuristic_token_count(prompt)
+        usage = FakeUsage(prompt_tokens + cached_tokens, heuristic_token_count(text), cached_tokens)
+        reading_seconds = prompt_tokens / self.prompt_tokens_per_second if self.prompt_tokens_per_second else 0.0
+        generation_seconds = usage.candidates_token_count / self.tokens_per_second
+        if not stream:
+            time.sleep(self.latency + reading_seconds + generation_seconds)
+            return FakeResponse(text, usage)
+        return self._stream(text, usage, reading_seconds, generation_seconds)
+
+    def _stream(self, text, usage, reading_seconds, generation_seconds):
+        time.sleep(self.latency + reading_seconds)
+        step = -(-len(text) // self.stream_chunks)
+        for start in range(0, len(text), step):
+            time.sleep(generation_seconds / self.stream_chunks)
+            last = start + step >= len(text)
+            # Like the real API, usage totals arrive with the final chunk
+            yield FakeResponse(text[start:start + step], usage if last else None)
+
+
+class FakeCachedContext:
+    """FakeModel calls made against a cached context: only the new prompt is read, timed and counted as fresh input"""
+
+    def __init__(self, model, cached_tokens):
+        self.model = model
+        self.cached_tokens = cached_tokens
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        return self.model.generate_content(prompt, stream=stream, cached_tokens=self.cached_tokens, **kwargs)
@@ -0,0 +1,290 @@
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+from caching import CountedLRUCache
+from extraction import format_page
+from summarizer import CLAUSE_BOUNDARY, PAGE_MARKER, Chunk
+
+# ARTICLE/SECTION lines, or short lines in capitals ("TERMINATION", "PAYMENT TERMS")
+HEADING = re.compile(
+    r"^[ \t]*(?:(?:ARTICLE|Article|SECTION|Section|SCHEDULE|Schedule|EXHIBIT|Exhibit)[ \t]+[0-9IVXLC]+\b[^\n]{0,80}"
+    r"|[A-Z][A-Z0-9 ,;:&'()/-]{3,80})[ \t]*$",
+    re.M,
+)
+# The number of a clause opening a line: "12.", "4.2", "7)"
+NUMBERED_CLAUSE = re.compile(r"^[ \t]*(\d{1,3}(?:\.\d{1,3})*)[.)]?[ \t]+(?=\S)", re.M)
+# A quoted, capitalised term followed by a closing parenthesis or "means" ("Rent" means ..., (the "Tenant"))
+DEFINED_TERM = re.compile(
+    r"[\"“]([A-Z][A-Za-z0-9'\- ]{0,60}?)[\"”](?=\s*\)|\s+(?:means|shall mean|refers to|(?:shall )?ha(?:s|ve) the meaning))"
+)
+MONEY = re.compile(
+    r"(?:[$€£₹]|\b(?:USD|EUR|GBP|INR|Rs\.?)[ \t]?)\d[\d,]*(?:\.\d+)?(?:[ \t]?(?:million|billion|thousand)\b)?"
+    r"|\b\d[\d,]*(?:\.\d+)?[ \t]?(?:dollars|euros|pounds|rupees)\b"
+)
+_MONTH = (
+    r"(?:January|February|March|April|May|June|July|August|September|October|November|December"
+    r"|Jan|Feb|Mar|Apr|Jun|Jul|Aug|Sept|Sep|Oct|Nov|Dec)\.?"
+)
+DATE = re.compile(
+    r"\b(?:\d{4}-\d{2}-\d{2}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}"
+    rf"|{_MONTH}[ \t]+\d{{1,2}}(?:st|nd|rd|th)?,?[ \t]+\d{{4}}"
+    rf"|\d{{1,2}}(?:st|nd|rd|th)?[ \t]+(?:of[ \t]+)?{_MONTH},?[ \t]+\d{{4}})\b"
+)
+# "clause 4.2", "Section 12" in a user's question
+CLAUSE_REFERENCE = re.compile(r"\b(?:clause|section|paragraph|article)\s+(\d{1,3}(?:\.\d{1,3})*)", re.I)
+# Characters Streamlit's Markdown would otherwise interpret ($ starts LaTeX)
+MARKDOWN_SPECIAL = re.compile(r"([\\`*_{}\[\]<>#|$~])")
+
+
+class Spans:
+    """Start/end offsets of regex matches, kept as two compact integer arrays in document order"""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, matches=(), group=0):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.extend(matches, group)
+
+    def extend(self, matches, group=0, offset=0):
+        """Append matches found in a slice of the text that begins at offset"""
+        for match in matches:
+            self.starts.append(offset + match.start(group))
+            self.ends.append(offset + match.end(group))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def within(self, start, end):
+        """(start, end) of the spans lying inside [start, end)"""
+        first = bisect_left(self.starts, start)
+        last = bisect_left(self.starts, end)
+        return [(s, e) for s, e in zip(self.starts[first:last], self.ends[first:last]) if e <= end]
+
+
+# Spans attribute of DocumentModel -> (pattern, group whose offsets are kept)
+FEATURES = {
+    "headings": (HEADING, 0),
+    "numbered_clauses": (NUMBERED_CLAUSE, 1),
+    "defined_terms": (DEFINED_TERM, 1),
+    "amounts": (MONEY, 0),
+    "dates": (DATE, 0),
+}
+
+
+class DocumentModel:
+    """Pages, clauses, headings, defined terms, amounts and dates of one document, as offsets into its text
+
+    Built with one regex pass per feature; everything else (chunks, passages, previews,
+    highlighting) slices the single text buffer by offset instead of rescanning it.
+    """
+
+    __slots__ = (
+        "text", "page_starts", "page_numbers", "clause_starts",
+        "headings", "numbered_clauses", "defined_terms", "amounts", "dates",
+    )
+
+    def __init__(self, text):
+        self.text = text
+        # Page boundaries follow split_pages: an unnumbered lead-in (if any), then one page per marker
+        markers = list(PAGE_MARKER.finditer(text))
+        self.page_starts = array("q")
+        self.page_numbers = array("q")  # 0 for unnumbered text
+        if not markers or text[:markers[0].start()].strip():
+            self.page_starts.append(0)
+            self.page_numbers.append(0)
+        for marker in markers:
+            self.page_starts.append(marker.start())
+            self.page_numbers.append(int(marker.group(1)))
+
+        self.clause_starts = array("q", (boundary.start() for boundary in CLAUSE_BOUNDARY.finditer(text)))
+        for name, (pattern, group) in FEATURES.items():
+            setattr(self, name, Spans(pattern.finditer(text), group))
+
+    def _page_end(self, index):
+        return self.page_starts[index + 1] if index + 1 < len(self.page_starts) else len(self.text)
+
+    def page_of(self, offset):
+        """Page number containing offset (None for unnumbered text)"""
+        index = bisect_right(self.page_starts, offset) - 1
+        return (self.page_numbers[index] or None) if index >= 0 else None
+
+    def pages(self):
+        """(page_number, text) pairs, the same as split_pages"""
+        for index, start in enumerate(self.page_starts):
+            yield self.page_numbers[index] or None, self.text[start:self._page_end(index)]
+
+    def _segments(self, start, end, max_chars):
+        """(start, end) of a page, or of its clauses (hard-wrapped) if the page is longer than max_chars"""
+        if end - start <= max_chars:
+            yield start, end
+            return
+        first = bisect_right(self.clause_starts, start)
+        last = bisect_left(self.clause_starts, end)
+        bounds = [start, *self.clause_starts[first:last], end]
+        for piece_start, piece_end in zip(bounds, bounds[1:]):
+            for offset in range(piece_start, piece_end, max_chars):
+                yield offset, min(offset + max_chars, piece_end)
+
+    def chunk_spans(self, max_chars, per_page=False):
+        """(first_page, last_page, start, end) for chunks packed like chunk_pages; segments are contiguous,
+        so each chunk is a single slice of the text. With per_page, chunks never cross a page."""
+        chunk_start = chunk_end = None
+        first_page = last_page = None
+        for index, page_start in enumerate(self.page_starts):
+            page_number = self.page_numbers[index] or None
+            if per_page and chunk_start is not None:
+                yield first_page, last_page, chunk_start, chunk_end
+                chunk_start = None
+            for start, end in self._segments(page_start, self._page_end(index), max_chars):
+                if chunk_start is not None and end - chunk_start > max_chars:
+                    yield first_page, last_page, chunk_start, chunk_end
+                    chunk_start = None
+                if chunk_start is None:
+                    chunk_start, first_page = start, page_number
+                chunk_end, last_page = end, page_number
+        if chunk_start is not None:
+            yield first_page, last_page, chunk_start, chunk_end
+
+    def chunks(self, max_chars):
+        """Same chunks as chunk_document(text, max_chars), sliced by offset"""
+        return [
+            Chunk(first_page, last_page, self.text[start:end])
+            for first_page, last_page, start, end in self.chunk_spans(max_chars)
+        ]
+
+    def clause_offset(self, number):
+        """Offset of the clause numbered `number` ("4.2"), or None"""
+        for start, end in self.numbered_clauses:
+            if self.text[start:end] == number:
+                return start
+        return None
+
+    def referenced_clauses(self, question):
+        """Offsets of the numbered clauses a question names explicitly ("what does clause 7 mean?")"""
+        offsets = (self.clause_offset(number) for number in CLAUSE_REFERENCE.findall(question))
+        return [offset for offset in offsets if offset is not None]
+
+    def preview(self, max_chars=1500):
+        """The opening text, cut at the last clause boundary inside max_chars when there is a sensible one"""
+        if len(self.text) <= max_chars:
+            return self.text
+        index = bisect_right(self.clause_starts, max_chars) - 1
+        cut = self.clause_starts[index] if index >= 0 else 0
+        if cut < max_chars // 2:
+            cut = max_chars
+        return self.text[:cut].rstrip() + "..."
+
+    def outline(self):
+        """(page_number, heading) for each heading in document order"""
+        return [(self.page_of(start), self.text[start:end].strip()) for start, end in self.headings]
+
+    def found(self, spans):
+        """(page_number, text) for each span of one feature, e.g. model.found(model.amounts)"""
+        return [(self.page_of(start), self.text[start:end]) for start, end in spans]
+
+    def highlight(self, start, end):
+        """Markdown for text[start:end] with amounts, dates and defined terms in bold"""
+        marks = sorted(
+            self.amounts.within(start, end) + self.dates.within(start, end) + self.defined_terms.within(start, end)
+        )
+        parts = []
+        position = start
+        for mark_start, mark_end in marks:
+            if mark_start < position:
+                continue  # Overlaps a span already highlighted
+            parts.append(MARKDOWN_SPECIAL.sub(r"\\\1", self.text[position:mark_start]))
+            parts.append("**" + MARKDOWN_SPECIAL.sub(r"\\\1", self.text[mark_start:mark_end]) + "**")
+            position = mark_end
+        parts.append(MARKDOWN_SPECIAL.sub(r"\\\1", self.text[position:end]))
+        return "".join(parts)
+
+
+class DocumentModelBuilder:
+    """Builds the DocumentModel of format_pages(pages).strip() from (page_number, text) records as they arrive
+
+    Each record is scanned once while extraction is still reading the next, so indexing and
+    chunking need no second pass over the joined text. Every pattern matches within a line, or
+    looks ahead across whitespace into the next, so only the last line read so far is held back
+    and rescanned with the next record.
+    """
+
+    def __init__(self):
+        self.pages = 0
+        self._parts = []
+        self._carry = ""  # The last line with text and the whitespace before it: its matches may depend on what follows
+        self._offset = 0  # Offset of the carry in the joined text
+        self._page_starts = array("q")
+        self._page_numbers = array("q")
+        self._clause_starts = array("q")
+        self._features = {name: Spans() for name in FEATURES}
+
+    def add(self, page_number, page_text):
+        self.pages += 1
+        part = format_page(page_number, page_text)
+        if not self._parts:
+            part = part.lstrip()
+            if not part:
+                return
+        self._parts.append(part)
+
+        scan = self._carry + part
+        last_line = scan.rfind("\n", 0, len(scan.rstrip())) + 1
+        held = len(scan[:last_line].rstrip())
+        self._scan(scan, held)
+        self._carry = scan[held:]
+        self._offset += held
+
+    def _scan(self, scan, end):
+        """Record the matches in scan that start before end"""
+        def before_end(matches):
+            for match in matches:
+                if match.start() >= end:
+                    break
+                yield match
+
+        for marker in before_end(PAGE_MARKER.finditer(scan)):
+            self._page_starts.append(self._offset + marker.start())
+            self._page_numbers.append(int(marker.group(1)))
+        self._clause_starts.extend(
+            self._offset + boundary.start() for boundary in before_end(CLAUSE_BOUNDARY.finditer(scan))
+        )
+        for name, (pattern, group) in FEATURES.items():
+            self._features[name].extend(before_end(pattern.finditer(scan)), group, self._offset)
+
+    def build(self):
+        """The joined, stripped text and its DocumentModel"""
+        scan = self._carry.rstrip()
+        self._scan(scan, len(scan))
+        text = "".join(self._parts).rstrip()
+        self._parts = []
+
+        model = DocumentModel.__new__(DocumentModel)
+        model.text = text
+        model.page_starts = self._page_starts
+        model.page_numbers = self._page_numbers
+        if not model.page_starts or model.page_starts[0] > 0:  # The text is stripped: anything before is a lead-in
+            model.page_starts.insert(0, 0)
+            model.page_numbers.insert(0, 0)
+        model.clause_starts = self._clause_starts
+        for name, spans in self._features.items():
+            setattr(model, name, spans)
+        return text, model
+
+
+_model_cache = CountedLRUCache(int(os.getenv("DOCUMENT_MODEL_CACHE_SIZE", 32)))
+
+
+def get_document_model(document_hash, text):
+    """Build the structured model of a document once and share it across requests and sessions"""
+    return _model_cache.get_or_create(document_hash, lambda: DocumentModel(text))
+
+
+def cache_document_model(document_hash, model):
+    """Share a model built while the document was extracted, so get_document_model needn't rebuild it"""
+    _model_cache.set(document_hash, model)
@@ -0,0 +1,414 @@
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
+
+# Parsers (PyMuPDF, PyPDF2, python-docx) are imported inside the functions that
+# need them, so they load on the first document of that type rather than at start-up
+
+# A document "source" is either its bytes, or the path of a file they were spilled to
+# (large uploads), which the parsers read from disk instead of holding a copy in memory
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_TYPE = "text/plain"
+SUPPORTED_TYPES = (PDF_TYPE, DOCX_TYPE, TEXT_TYPE)
+
+SPILL_CHUNK_BYTES = 1024 * 1024
+
+
+# Replacement, private-use and control characters: what undecodable fonts turn into
+UNREADABLE_CHARS = re.compile(r"[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]")
+# Pages whose PyMuPDF text scores below this are also tried with PyPDF2, keeping the better result
+MIN_PAGE_QUALITY = 0.9
+
+# How each page was extracted; parser is "pymupdf" or "pypdf2", error is the PyMuPDF failure if any
+PageStats = namedtuple("PageStats", "page_number parser seconds chars quality error")
+
+
+class DocumentTooLarge(ValueError):
+    pass
+
+
+def text_quality(text):
+    """Share of characters that are readable (0.0 for a blank page, e.g. a scanned image)"""
+    if not text.strip():
+        return 0.0
+    return 1 - len(UNREADABLE_CHARS.findall(text)) / len(text)
+
+
+# Source of the PDF being extracted, set once per worker process by _init_worker
+_worker_pdf_source = None
+
+
+def _init_worker(pdf_source):
+    global _worker_pdf_source
+    _worker_pdf_source = pdf_source
+
+
+def spill_to_file(buffer, suffix="", directory=None):
+    """Write a buffer (e.g. an upload's memoryview) to a temporary file in chunks and return its path"""
+    with tempfile.NamedTemporaryFile("wb", suffix=suffix, dir=directory, delete=False) as f:
+        for start in range(0, len(buffer), SPILL_CHUNK_BYTES):
+            f.write(buffer[start:start + SPILL_CHUNK_BYTES])
+    return f.name
+
+
+def open_pdf(pdf_source):
+    """Open a PDF with PyMuPDF; a spilled file is read from disk on demand rather than loaded whole"""
+    import fitz  # PyMuPDF
+
+    if isinstance(pdf_source, str):
+        return fitz.open(pdf_source, filetype="pdf")
+    return fitz.open(stream=pdf_source, filetype="pdf")
+
+
+@contextmanager
+def open_pypdf2(pdf_source):
+    """Open a PDF with PyPDF2 without copying its bytes"""
+    import PyPDF2
+
+    if isinstance(pdf_source, str):
+        # An open file, not the path: given a path, PyPDF2 reads the whole file into memory
+        with open(pdf_source, "rb") as f:
+            yield PyPDF2.PdfReader(f)
+    else:
+        # BytesIO shares the bytes object rather than copying it, since it is never written to
+        yield PyPDF2.PdfReader(io.BytesIO(pdf_source))
+
+
+class PageExtractor:
+    """Extract pages one at a time with PyMuPDF, retrying only failing or garbled pages with PyPDF2
+
+    The PyPDF2 reader is opened on the first page that needs it, so clean documents never pay for it.
+    """
+
+    def __init__(self, pdf_source, pdf_document):
+        self.pdf_source = pdf_source
+        self.pdf_document = pdf_document
+        self._fallback = ExitStack()
+        self._fallback_reader = None
+
+    def _fallback_text(self, page_num):
+        if self._fallback_reader is None:
+            self._fallback_reader = self._fallback.enter_context(open_pypdf2(self.pdf_source))
+        return self._fallback_reader.pages[page_num].extract_text() or ""
+
+    def extract(self, page_num):
+        """Return (text, PageStats) for the zero-based page_num"""
+        started = time.perf_counter()
+        parser, error = "pymupdf", None
+        try:
+            text = self.pdf_document[page_num].get_text()
+            quality = text_quality(text)
+        except Exception as e:
+            text, quality, error = "", 0.0, f"{type(e).__name__}: {e}"
+
+        if error or (text.strip() and quality < MIN_PAGE_QUALITY):
+            try:
+                fallback_text = self._fallback_text(page_num)
+                fallback_quality = text_quality(fallback_text)
+                if error or fallback_quality > quality:
+                    text, quality, parser = fallback_text, fallback_quality, "pypdf2"
+            except Exception:
+                pass  # Keep what PyMuPDF managed (nothing, if it raised)
+
+        stats = PageStats(page_num + 1, parser, round(time.perf_counter() - started, 4), len(text), round(quality, 3), error)
+        return text, stats
+
+    def close(self):
+        self._fallback.close()
+
+
+def _extract_page_range(page_range):
+    """Worker: open the shared PDF and return (text, PageStats) for pages [start, stop)"""
+    start, stop = page_range
+    with open_pdf(_worker_pdf_source) as pdf_document:
+        extractor = PageExtractor(_worker_pdf_source, pdf_document)
+        try:
+            return [extractor.extract(page_num) for page_num in range(start, stop)]
+        finally:
+            extractor.close()
+
+
+def page_ranges(page_count, parts):
+    """Split range(page_count) into at most `parts` contiguous (start, stop) ranges"""
+    parts = max(1, min(parts, page_count))
+    step, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        stop = start + step + (1 if part < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def iter_pdf_pages(pdf_source, max_workers=None, min_parallel_pages=None, stats=None):
+    """Yield (page_number, text) for each PDF page in order, splitting large documents across a process pool
+
+    A PageStats record for each page is appended to stats, if given.
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+    if min_parallel_pages is None:
+        min_parallel_pages = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 200))
+
+    with open_pdf(pdf_source) as pdf_document:
+        page_count = pdf_document.page_count
+        # Small documents: worker start-up would cost more than it saves
+        if max_workers <= 1 or page_count < min_parallel_pages:
+            extractor = PageExtractor(pdf_source, pdf_document)
+            try:
+                for page_num in range(page_count):
+                    page_text, page_stats = extractor.extract(page_num)
+                    if stats is not None:
+                        stats.append(page_stats)
+                    yield page_num + 1, page_text
+            finally:
+                extractor.close()
+            return
+
+    # Several ranges per worker so one slow range doesn't leave the others idle
+    ranges = page_ranges(page_count, max_workers * 4)
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers, len(ranges)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        # Workers of a spilled upload get its path rather than a pickled copy of the bytes
+        initargs=(pdf_source,),
+    ) as executor:
+        # map() hands back ranges in order as soon as each one (and those before it) is done
+        for (start, _), range_pages in zip(ranges, executor.map(_extract_page_range, ranges)):
+            for offset, (page_text, page_stats) in enumerate(range_pages):
+                if stats is not None:
+                    stats.append(page_stats)
+                yield start + offset + 1, page_text
+
+
+def iter_pypdf2_pages(pdf_source, start_page=1, stats=None):
+    """Yield (page_number, text) with PyPDF2, beginning at start_page"""
+    with open_pypdf2(pdf_source) as pdf_reader:
+        for page_num in range(start_page - 1, len(pdf_reader.pages)):
+            started = time.perf_counter()
+            page_text = pdf_reader.pages[page_num].extract_text() or ""
+            if stats is not None:
+                stats.append(PageStats(
+                    page_num + 1, "pypdf2", round(time.perf_counter() - started, 4),
+                    len(page_text), round(text_quality(page_text), 3), None,
+                ))
+            yield page_num + 1, page_text
+
+
+def iter_document_pages(source, file_type, warn=None, stats=None):
+    """Yield (page_number, text) records as they are parsed; DOCX and text files yield records with no page number
+
+    For PDFs, a PageStats record for each page is appended to stats, if given.
+    """
+    if file_type == PDF_TYPE:
+        # PyMuPDF first (better for complex PDFs); pages it fails on are retried one by one with PyPDF2
+        next_page = 1
+        try:
+            for page_number, page_text in iter_pdf_pages(source, stats=stats):
+                yield page_number, page_text
+                next_page = page_number + 1
+        except Exception as e:
+            # Only if PyMuPDF can't open the file at all, or a worker dies
+            if warn:
+                warn(f"PyMuPDF failed, trying PyPDF2: {str(e)}")
+            # Pages already yielded stand; PyPDF2 picks up from the one that failed
+            yield from iter_pypdf2_pages(source, start_page=next_page, stats=stats)
+
+    elif file_type == DOCX_TYPE:
+        yield from iter_docx_records(source)
+
+    elif file_type == TEXT_TYPE:
+        if isinstance(source, str):
+            with open(source, encoding="utf-8") as f:
+                yield None, f.read()
+        else:
+            yield None, source.decode("utf-8")
+
+    else:
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+RELATIONSHIP_NAMESPACE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+MARKUP_COMPATIBILITY_NAMESPACE = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+# DOCX text is handed on in records of about this many characters rather than all at once
+DOCX_RECORD_CHARS = 64 * 1024
+
+
+def iter_docx_blocks(part):
+    """Yield the text of each paragraph and table row of a WordprocessingML part (an open file), in document order
+
+    Read with iterparse rather than python-docx's object model: each block is cleared once its text is out,
+    so memory stays flat however long the document. A table row is its cells joined with " | ", and a text
+    box's paragraphs are lines of their own after the paragraph anchoring it. Of the alternative renderings
+    in mc:AlternateContent, only mc:Choice is read; mc:Fallback repeats the same text for older readers.
+    """
+    from xml.etree import ElementTree
+
+    paragraph_tag, table_tag = WORD_NAMESPACE + "p", WORD_NAMESPACE + "tbl"
+    table_row_tag, table_cell_tag = WORD_NAMESPACE + "tr", WORD_NAMESPACE + "tc"
+    text_tag, tab_tag, properties_tag = WORD_NAMESPACE + "t", WORD_NAMESPACE + "tab", WORD_NAMESPACE + "pPr"
+    break_tags, break_type = {WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr"}, WORD_NAMESPACE + "type"
+    container_tags = {WORD_NAMESPACE + "body", WORD_NAMESPACE + "hdr", WORD_NAMESPACE + "ftr"}
+    fallback_tag = MARKUP_COMPATIBILITY_NAMESPACE + "Fallback"
+
+    container = None  # The element top-level blocks are children of, cleared as each one is done
+    paragraphs = []  # Runs of each open paragraph (text boxes put paragraphs inside paragraphs)
+    anchored = []  # Lines of the text boxes in each open paragraph, emitted after it
+    cells = []  # Paragraphs of each open table cell
+    rows = []  # Cells of each open table row
+    holders = []  # paragraph_tag or table_cell_tag for each open paragraph and cell, innermost last
+    in_properties = 0  # Inside paragraph properties, where <w:tab> is a tab stop rather than a tab
+    in_fallback = 0  # Inside mc:Fallback, whose text has already been read from mc:Choice
+
+    for event, element in ElementTree.iterparse(part, events=("start", "end")):
+        tag = element.tag
+        if tag == fallback_tag:
+            in_fallback += 1 if event == "start" else -1
+            continue
+        if in_fallback:
+            continue
+        if event == "start":
+            if tag == paragraph_tag:
+                paragraphs.append([])
+                anchored.append([])
+                holders.append(tag)
+            elif tag == table_cell_tag:
+                cells.append([])
+                holders.append(tag)
+            elif tag == table_row_tag:
+                rows.append([])
+            elif tag == properties_tag:
+                in_properties += 1
+            elif tag in container_tags and container is None:
+                container = element
+            continue
+
+        if tag == text_tag:
+            if paragraphs:
+                paragraphs[-1].append(element.text or "")
+        elif tag == tab_tag:
+            if paragraphs and not in_properties:
+                paragraphs[-1].append("\t")
+        elif tag in break_tags:
+            # Page and column breaks only move the text on; line breaks are part of it
+            if paragraphs and element.get(break_type) in (None, "textWrapping"):
+                paragraphs[-1].append("\n")
+        elif tag == properties_tag:
+            in_properties -= 1
+        elif tag == table_cell_tag:
+            holders.pop()
+            rows[-1].append(" ".join(text for text in cells.pop() if text))
+        elif tag in (paragraph_tag, table_row_tag, table_tag):
+            if tag == paragraph_tag:
+                holders.pop()
+                lines = ["".join(paragraphs.pop())] + anchored.pop()
+            elif tag == table_row_tag:
+                lines = [" | ".join(rows.pop())]
+            else:
+                lines = []
+            holder = holders[-1] if holders else None
+            if holder == table_cell_tag:
+                cells[-1].extend(lines)  # A paragraph, or a nested table's row, inside a table cell
+            elif holder == paragraph_tag:
+                anchored[-1].extend(lines)  # A text box's paragraph or table row, inside the paragraph anchoring it
+            else:
+                yield from lines
+
+            if not (paragraphs or cells or rows):
+                if tag == table_row_tag:
+                    element.clear()  # The table is still open; drop just the finished row
+                elif container is not None:
+                    container.clear()
+
+
+def docx_header_footer_parts(archive):
+    """(headers, footers): part names in the archive, from the main document's relationships"""
+    from xml.etree import ElementTree
+
+    headers, footers = [], []
+    try:
+        with archive.open("word/_rels/document.xml.rels") as f:
+            relationships = ElementTree.parse(f).getroot()
+    except KeyError:
+        return headers, footers
+    for relationship in relationships.iter(RELATIONSHIP_NAMESPACE + "Relationship"):
+        kind = relationship.get("Type", "").rsplit("/", 1)[-1]
+        target = relationship.get("Target", "")
+        name = target.lstrip("/") if target.startswith("/") else "word/" + target
+        if kind == "header":
+            headers.append(name)
+        elif kind == "footer":
+            footers.append(name)
+    return sorted(headers), sorted(footers)
+
+
+def iter_docx_lines(source):
+    """Yield the lines of a DOCX's text: headers, then the body's paragraphs and table rows, then footers"""
+    import zipfile
+
+    with zipfile.ZipFile(source if isinstance(source, str) else io.BytesIO(source)) as archive:
+        headers, footers = docx_header_footer_parts(archive)
+        seen = set()
+
+        def section_parts(names):
+            # Each section can have its own first-page, even and default parts, often with the same text
+            for name in names:
+                try:
+                    with archive.open(name) as part:
+                        lines = [line for line in iter_docx_blocks(part) if line.strip()]
+                except KeyError:
+                    continue
+                if lines and tuple(lines) not in seen:
+                    seen.add(tuple(lines))
+                    yield from lines
+
+        yield from section_parts(headers)
+        with archive.open("word/document.xml") as part:
+            yield from iter_docx_blocks(part)
+        yield from section_parts(footers)
+
+
+def iter_docx_records(source, record_chars=DOCX_RECORD_CHARS):
+    """Yield (None, text) records of whole lines, each about record_chars long, as the DOCX is read"""
+    lines = []
+    size = 0
+    for line in iter_docx_lines(source):
+        lines.append(line)
+        size += len(line) + 1
+        if size >= record_chars:
+            yield None, "\n".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield None, "\n".join(lines)
+
+
+def count_pages(source, file_type):
+    """Page count for PDFs (cheap: only the page tree is read), None for other types"""
+    if file_type != PDF_TYPE:
+        return None
+    try:
+        with open_pdf(source) as pdf_document:
+            return pdf_document.page_count
+    except Exception:
+        return None
+
+
+def format_page(page_number, page_text):
+    """One record as it appears in the joined text, PDF pages tagged with the marker the rest of the app relies on"""
+    return f"\n--- Page {page_number} ---\n{page_text}\n" if page_number is not None else f"{page_text}\n"
+
+
+def format_pages(pages):
+    """Join (page_number, text) records once"""
+    return "".join(format_page(page_number, page_text) for page_number, page_text in pages)
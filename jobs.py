@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """One background task; parts collects any output produced along the way, so pollers can show progress"""
+
+    def __init__(self, key):
+        self.key = key
+        self.status = QUEUED
+        self.parts = []
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def append(self, text):
+        self.parts.append(text)
+
+    @property
+    def text(self):
+        """The result once finished, otherwise whatever has been produced so far"""
+        return self.result if self.status == DONE else "".join(self.parts)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - (self.started or self.submitted)
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or timeout passes; True if it has finished"""
+        return self._done.wait(timeout)
+
+
+class JobQueue:
+    """Run tasks on a bounded worker pool outside the Streamlit script thread, one job per key
+
+    Submitting a key that is already queued, running or done returns that job rather than starting
+    another, so duplicate requests (a double click, a rerun, a second session) share one run. Finished
+    jobs are kept for later polls up to max_finished, oldest dropped first; failed jobs are retried
+    on the next submit.
+    """
+
+    def __init__(self, max_workers=4, max_finished=256):
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queue fn(job, *args, **kwargs) under key, or return the existing job for key; fn's return value is the result"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status != FAILED:
+                self._jobs.move_to_end(key)
+                return job
+            job = Job(key)
+            self._jobs[key] = job
+            self._evict()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def _run(self, job, fn, args, kwargs):
+        job.started = time.time()
+        job.status = RUNNING
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            job._done.set()
+
+    def _evict(self):
+        # Only finished jobs are dropped; a job still in flight is always found by its key
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[key]
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Process-wide job queue, so every session's analyses share one pool of workers"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(
+                max_workers=int(os.getenv("JOB_WORKERS", 4)),
+                max_finished=int(os.getenv("JOB_HISTORY", 256)),
+            )
+        return _job_queue
@@ -0,0 +1,86 @@
+import os
+import re
+from bisect import bisect_right
+from collections import namedtuple
+
+from caching import CountedLRUCache
+from document import MONEY, get_document_model
+
+# (group name, label, pattern); matched together in one pass, so earlier rules win where they overlap
+RULES = [
+    ("late_fee", "Late fee", r"(?i:\blate (?:fee|charge|payment (?:fee|charge|penalty))s?\b)"),
+    ("exit_cost", "Exit cost", r"(?i:\b(?:early termination|termination (?:fee|charge)|cancell?ation (?:fee|charge)|break fee|exit fee)s?\b)"),
+    ("penalty", "Penalty", r"(?i:\b(?:penalt(?:y|ies)|liquidated damages|forfeit(?:s|ed|ure)?)\b)"),
+    ("auto_renewal", "Auto-renewal", r"(?i:\b(?:auto(?:matic(?:ally)?)?[- ]?renew(?:s|al|ed)?|renews? automatically|evergreen)\b)"),
+    ("notice_period", "Notice period", r"(?i:\b\d{1,3}(?:[ \t]+\(\w+\))?[ \t-]+(?:calendar |business |working )?(?:days?|weeks?|months?)'?[ \t]+(?:prior[ \t]+)?(?:advance[ \t]+)?(?:written[ \t]+)?notice\b)"),
+    ("deadline", "Deadline", r"(?i:\b(?:within|no later than|not later than|not less than)[ \t]+\d{1,3}[ \t]+(?:calendar |business |working )?(?:days?|weeks?|months?)\b)"),
+    ("deposit", "Deposit", r"(?i:\b(?:security|damage|refundable|non-refundable) deposit\b)"),
+    ("interest", "Interest / rate", r"(?i:\b(?:interest rate|annual percentage rate|APR|interest)\b)"),
+    ("percentage", "Percentage", r"\b\d{1,3}(?:\.\d+)?[ \t]?(?:%|(?i:percent|per cent)\b)"),
+    ("indemnity", "Indemnity / liability", r"(?i:\b(?:indemnif(?:y|ies|ication)|hold harmless|unlimited liability|jointly and severally)\b)"),
+    ("waiver", "Rights waived", r"(?i:\b(?:binding arbitration|class action|waives?|waiver)\b)"),
+    ("amount", "Amount", MONEY.pattern),
+]
+RULE_LABELS = {name: label for name, label, _ in RULES}
+# Every rule starts at a word boundary or a currency symbol, so positions inside a word are rejected
+# by the leading guard before any of the alternatives are tried
+SCANNER = re.compile(
+    r"(?:(?<!\w)|(?=[$€£₹]))(?:" + "|".join(f"(?P<{name}>{pattern})" for name, _, pattern in RULES) + ")"
+)
+
+# How much of the surrounding clause to keep with each finding
+CONTEXT_CHARS = 240
+
+Finding = namedtuple("Finding", "rule page start end text")
+
+
+def scan(model):
+    """Every rule match in a DocumentModel's text, found in a single pass, in document order"""
+    return [
+        Finding(match.lastgroup, model.page_of(match.start()), match.start(), match.end(), match.group())
+        for match in SCANNER.finditer(model.text)
+    ]
+
+
+def clause_bounds(model, offset):
+    """(start, end) of the clause containing offset, clipped to CONTEXT_CHARS around it"""
+    index = bisect_right(model.clause_starts, offset) - 1
+    start = model.clause_starts[index] if index >= 0 else 0
+    end = model.clause_starts[index + 1] if index + 1 < len(model.clause_starts) else len(model.text)
+    start = max(start, offset - CONTEXT_CHARS // 2)
+    end = min(end, start + CONTEXT_CHARS)
+    return start, end
+
+
+def context(model, finding):
+    start, end = clause_bounds(model, finding.start)
+    snippet = " ".join(model.text[start:end].split())
+    return snippet if end - start < CONTEXT_CHARS else snippet + "..."
+
+
+def format_digest(model, findings, max_chars=20000):
+    """Compact text of the clauses with findings, richest first, for the risks prompt in place of the document"""
+    clauses = {}
+    for finding in findings:
+        bounds = clause_bounds(model, finding.start)
+        clauses.setdefault(bounds, set()).add(RULE_LABELS[finding.rule])
+
+    # Clauses matching several kinds of rule first (a late fee with an amount), then in document order
+    ranked = sorted(clauses.items(), key=lambda item: (-len(item[1]), item[0][0]))
+    lines = []
+    size = 0
+    for (start, end), labels in ranked:
+        line = f"[Page {model.page_of(start) or '-'}] ({', '.join(sorted(labels))}) {' '.join(model.text[start:end].split())}"
+        if size + len(line) > max_chars:
+            break
+        lines.append((start, line))
+        size += len(line) + 1
+    return "\n".join(line for _, line in sorted(lines))
+
+
+_scan_cache = CountedLRUCache(int(os.getenv("PRESCAN_CACHE_SIZE", 32)))
+
+
+def get_findings(document_hash, text):
+    """Scan a document once and share the findings across requests and sessions"""
+    return _scan_cache.get_or_create(document_hash, lambda: scan(get_document_model(document_hash, text)))
@@ -0,0 +1,199 @@
+"""Prompt templates sent to the model"""
+
+# Bump whenever a template changes so cached responses from older prompts are not reused
+PROMPT_VERSION = "3"
+
+ANALYSIS_PROMPTS = {
+    "summary": """
+You are a financial and legal expert who specializes in explaining complex legal documents that impact people's money and financial well-being.
+
+Please analyze this legal document and provide:
+1. **Plain English Summary**: What is this document about? (as if explaining to someone with no legal background)
+2. **Financial Impact**: How will this affect the person's money, assets, or financial obligations?
+3. **Key Terms & Conditions**: What are the most important rules they need to follow?
+4. **Cost Breakdown**: All fees, charges, penalties, and potential additional costs
+5. **Your Rights**: What protections and rights do you have?
+6. **Red Flags**: Any concerning clauses that could lead to financial loss
+
+Legal Document:
+{text}
+
+Please use simple language and focus on the financial implications. Highlight any terms that could cost money or create financial obligations.
+""",
+
+    "risks": """
+You are a financial advisor helping someone understand the financial and legal risks in this document.
+
+Analyze this document and identify:
+1. **Financial Risks**: 
+   - Hidden fees, charges, or penalties
+   - Variable costs that could increase
+   - Situations where you might owe money
+   - Impact on credit score or financial standing
+
+2. **Legal Obligations**: 
+   - What you MUST do (and what it costs if you don't)
+   - Deadlines and time-sensitive requirements
+   - Automatic renewals or extensions
+
+3. **Rights You're Giving Up**: 
+   - Ability to sue or seek damages
+   - Privacy rights with your data
+   - Freedom to choose alternatives
+
+4. **Exit Costs**: 
+   - Cancellation fees or penalties
+   - Early termination costs
+   - What happens to deposits or payments made
+
+5. **Warning Signs**: 
+   - Unusual or one-sided clauses
+   - Terms that seem too good to be true
+   - Vague language around costs
+
+Legal Document:
+{text}
+
+For each risk, explain the potential financial impact and provide practical advice on how to protect yourself.
+""",
+
+    "questions": """
+You are helping someone prepare smart questions to ask before signing this legal document to protect their financial interests.
+
+Based on this document, here are the important questions they should ask:
+
+**About Money & Costs:**
+1. What are ALL the fees involved? (setup, monthly, annual, hidden charges)
+2. Can costs increase over time? By how much and how often?
+3. What triggers penalty fees and how much are they?
+4. Are there any situations where I might owe additional money?
+
+**About Terms & Flexibility:**
+5. Can I cancel this agreement? What does it cost to get out?
+6. What happens if I miss a payment or deadline?
+7. Does this automatically renew? How do I opt out?
+8. Can you change the terms without my agreement?
+
+**About Protection & Rights:**
+9. What happens if you don't deliver what's promised?
+10. Do I have any recourse if there's a dispute?
+11. Is my personal/financial information protected?
+12. What are my rights if something goes wrong?
+
+**About Specific Clauses:**
+[Based on the document content, add 3-5 specific questions about unclear or concerning terms]
+
+Legal Document:
+{text}
+
+Provide specific questions tailored to this document that will help them make an informed financial decision.
+""",
+}
+
+# The document part comes first and never varies between questions, so it can be sent once as a cached
+# context (QUESTION_DOCUMENT) with each question then sending only QUESTION_ASK
+QUESTION_DOCUMENT = """
+You are a financial and legal expert helping someone understand their legal document, particularly focusing on financial implications.
+
+Document: {text}
+"""
+
+QUESTION_ASK = """
+Question: {user_question}
+
+Please provide a clear, practical answer that:
+1. Directly answers their question in simple terms
+2. Explains any financial impact or cost implications
+3. Highlights risks or benefits they should know about
+4. Suggests practical next steps or things to watch out for
+
+Focus on how this affects their money, rights, and financial security.
+"""
+
+QUESTION_PROMPT = QUESTION_DOCUMENT + QUESTION_ASK
+
+EXCERPT_QUESTION_PROMPT = """
+You are a financial and legal expert helping someone understand their legal document, particularly focusing on financial implications.
+
+Below are the excerpts of the document most relevant to their question, each labelled with its page.
+
+Document Excerpts:
+{passages}
+
+Question: {user_question}
+
+Please provide a clear, practical answer that:
+1. Directly answers their question in simple terms, citing the page numbers you relied on
+2. Explains any financial impact or cost implications
+3. Highlights risks or benefits they should know about
+4. Suggests practical next steps or things to watch out for
+
+If the excerpts do not cover the question, say so rather than guessing.
+Focus on how this affects their money, rights, and financial security.
+"""
+
+CHUNK_FOCUS = {
+    "summary": "what this part is about, who must pay what and when, key rules, rights, and any clause that could lead to financial loss",
+    "risks": "hidden fees, penalties, variable costs, obligations and deadlines, automatic renewals, rights being waived, exit costs, and one-sided or vague clauses",
+    "questions": "unclear, unusual or concerning terms the reader should ask about before signing, especially around money, cancellation and liability",
+}
+
+CHUNK_PROMPT = """
+You are a financial and legal expert reading one part ({location}) of a longer legal document.
+
+Write concise notes on this part only, covering {focus}.
+Quote exact amounts, percentages, dates and notice periods, and mention the page number for each point.
+If this part contains nothing relevant, reply with "No relevant terms."
+
+Document Part:
+{text}
+"""
+
+REDUCE_NOTES = """
+The document was too long to read at once, so it was analysed in parts.
+Below are notes from each part, in document order. Treat them as the full document.
+
+{notes}
+"""
+
+RISK_DIGEST = """
+The document was too long to send in full, so a local scan picked out every clause that mentions
+amounts, percentages, fees, penalties, renewals, notice periods, deadlines, deposits or waived rights.
+Each line gives the page, what the scan found, and the clause text. Treat them as the relevant parts of the document.
+
+{digest}
+"""
+
+CROSS_DOCUMENT_PROMPT = """
+You are a financial and legal expert reviewing a set of related legal documents that someone is signing together
+(for example a lease with its addenda and an insurance policy).
+
+Each document has already been analysed on its own. The analyses are below, one per document, labelled with the file name.
+
+{documents}
+
+Using only these analyses, write a combined review that covers:
+1. **How the Documents Fit Together**: what each one does and which terms in one change or override another
+2. **Total Financial Picture**: every cost, fee, deposit and penalty across all the documents, with the document each comes from
+3. **Conflicts & Gaps**: terms that contradict each other, or risks that none of the documents covers
+4. **Biggest Risks Overall**: the most important things to watch, in order of financial impact
+5. **Before You Sign**: the key questions to ask, naming the document each question is about
+
+Use simple language and focus on the financial implications.
+"""
+
+UPDATE_ANALYSIS_PROMPT = """
+You are a financial and legal expert. You have already analysed a legal document. The document below is a new
+version built from the same template: most of it is identical, and only the clauses listed have changed
+(typically names, dates, amounts or a few terms).
+
+Your earlier analysis of the original version:
+{analysis}
+
+The clauses that differ, as they read in the original (Before) and in the new version (After):
+{changes}
+
+Rewrite the analysis so that it is correct for the new version. Keep everything the changes don't affect, update
+every name, date, amount and term that changed, and add or remove points where a change creates or removes a
+financial risk. Keep the same structure and headings as the earlier analysis, and use simple language.
+"""
@@ -0,0 +1,142 @@
+import heapq
+import importlib
+import math
+import os
+import re
+from bisect import bisect_right
+from collections import Counter, defaultdict, namedtuple
+
+from caching import CountedLRUCache
+from document import get_document_model
+from summarizer import PAGE_MARKER
+
+TOKEN = re.compile(r"[a-z0-9]+(?:[.,]\d+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have i if in is it its me my of on or "
+    "so that the their there this to was what when where which who will with you your".split()
+)
+
+# start/end: offsets of the passage in the document text
+Passage = namedtuple("Passage", "index page text start end")
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def build_passages_from_model(model, max_chars=1500):
+    """Split a document into clause-sized passages that never straddle a page, from its DocumentModel's offsets"""
+    passages = []
+    for page_number, _, start, end in model.chunk_spans(max_chars, per_page=True):
+        passage_text = PAGE_MARKER.sub("", model.text[start:end]).strip()
+        if passage_text:
+            passages.append(Passage(len(passages), page_number, passage_text, start, end))
+    return passages
+
+
+class DocumentIndex:
+    """BM25 index over a document's passages, optionally blended with embedding similarity"""
+
+    def __init__(self, passages, embedder=None, k1=1.5, b=0.75, embedding_weight=0.5):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.embedder = embedder
+        self.embedding_weight = embedding_weight
+
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for passage in passages:
+            terms = tokenize(passage.text)
+            self.lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self.postings[term].append((passage.index, count))
+
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.idf = {
+            term: math.log(1 + (len(passages) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+        self.embeddings = None
+        if embedder is not None and passages:
+            self.embeddings = self._normalize(embedder([p.text for p in passages]))
+
+    def passage_at(self, offset):
+        """The passage containing a document offset"""
+        starts = [passage.start for passage in self.passages]
+        index = bisect_right(starts, offset) - 1
+        if index >= 0 and offset < self.passages[index].end:
+            return self.passages[index]
+        return None
+
+    @staticmethod
+    def _normalize(vectors):
+        import numpy as np  # Only the optional embedding path needs NumPy
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def bm25_scores(self, query):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, count in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.lengths[index] / self.average_length
+                scores[index] += idf * count * (self.k1 + 1) / (count + self.k1 * length_norm)
+        return scores
+
+    def search(self, query, top_k=5):
+        """Return the top_k passages for query, best first"""
+        scores = self.bm25_scores(query)
+
+        if self.embeddings is not None:
+            import numpy as np
+
+            query_vector = self._normalize(self.embedder([query])[0])
+            similarity = self.embeddings @ query_vector
+            best_bm25 = max(scores.values(), default=0.0) or 1.0
+            blended = np.zeros(len(self.passages), dtype=np.float32)
+            for index, score in scores.items():
+                blended[index] = (1 - self.embedding_weight) * score / best_bm25
+            blended += self.embedding_weight * similarity
+            scores = dict(enumerate(blended.tolist()))
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        matches = [self.passages[index] for index, score in best if score > 0]
+        # Nothing matched (e.g. a vague question): fall back to the opening passages
+        return matches or self.passages[:top_k]
+
+
+def load_embedder():
+    """Import the embedder named by RETRIEVAL_EMBEDDER ("module:function"), if any"""
+    spec = os.getenv("RETRIEVAL_EMBEDDER")
+    if not spec:
+        return None
+    module_name, _, function_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+_index_cache = CountedLRUCache(int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", 32)))
+
+
+def get_document_index(document_hash, text):
+    """Build the index for a document once and share it across questions and sessions"""
+    return _index_cache.get_or_create(
+        document_hash,
+        lambda: DocumentIndex(
+            build_passages_from_model(get_document_model(document_hash, text)), embedder=load_embedder()
+        ),
+    )
+
+
+def format_passages(passages):
+    """Render passages in document order, each tagged with its page for citation"""
+    blocks = []
+    for passage in sorted(passages, key=lambda p: p.index):
+        label = f"Page {passage.page}" if passage.page is not None else "Document"
+        blocks.append(f"[{label}]\n{passage.text}")
+    return "\n\n".join(blocks)
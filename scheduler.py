@@ -0,0 +1,234 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+# Request priorities: lower runs first
+INTERACTIVE = 0
+ANALYSIS = 1
+BATCH = 2
+
+# google.api_core exception names worth retrying (quota, overload and transient server errors)
+RETRYABLE_ERRORS = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "GatewayTimeout",
+}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMIT_ERRORS = {"ResourceExhausted", "TooManyRequests"}
+
+
+def is_retryable(error):
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+
+def is_rate_limited(error):
+    return type(error).__name__ in RATE_LIMIT_ERRORS or getattr(error, "code", None) == 429
+
+
+class TokenBucket:
+    """Refills continuously at rate_per_minute, holding at most one minute's worth"""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount):
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class StreamedResponse:
+    """A streamed model response that keeps its scheduler slot until it is exhausted, fails or is closed
+
+    The call returns as soon as the stream opens, but the model is busy until the last chunk arrives,
+    so the slot has to outlive the call. Other attributes are read from the wrapped response.
+    """
+
+    def __init__(self, scheduler, response):
+        self._scheduler = scheduler
+        self._response = response
+        self._finished = False
+        self._iterator = iter(response)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+
+    def close(self):
+        """Release the slot of a stream the caller stops reading early"""
+        self._finish(abandoned=True)
+
+    def _finish(self, error=None, abandoned=False):
+        if self._finished:
+            return
+        self._finished = True
+        self._scheduler._release()
+        if error is not None:
+            self._scheduler._record_error(error, retry=False)  # Chunks may have been read already
+        elif not abandoned:
+            self._scheduler._record_success()
+
+    def __del__(self):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class RequestScheduler:
+    """Gate model calls by priority, request/token rate limits and an adaptive concurrency limit, retrying transient errors"""
+
+    def __init__(
+        self,
+        requests_per_minute=60,
+        tokens_per_minute=1_000_000,
+        max_concurrency=8,
+        min_concurrency=1,
+        max_retries=5,
+        base_delay=1.0,
+        max_delay=60.0,
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.active = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def call(self, fn, *args, priority=ANALYSIS, tokens=1, **kwargs):
+        """Run fn(*args, **kwargs) once a slot and rate budget are free, retrying transient errors with jittered backoff
+
+        With stream=True the response comes back as a StreamedResponse, which holds the slot until the
+        stream ends; only errors opening the stream are retried.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority, tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._release()
+                retry = is_retryable(e) and attempt < self.max_retries
+                self._record_error(e, retry)
+                if not retry:
+                    raise
+                # Full jitter keeps retrying callers from stampeding back together
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            else:
+                if kwargs.get("stream"):
+                    return StreamedResponse(self, result)
+                self._release()
+                self._record_success()
+                return result
+
+    def _acquire(self, priority, tokens):
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                if self._waiting[0] == ticket and self.active < int(self.concurrency_limit):
+                    delay = max(self.request_bucket.delay_for(1), self.token_bucket.delay_for(tokens))
+                    if delay == 0:
+                        break
+                    self._condition.wait(timeout=delay)
+                else:
+                    self._condition.wait()
+
+            heapq.heappop(self._waiting)
+            self.request_bucket.take(1)
+            self.token_bucket.take(tokens)
+            self.active += 1
+            self.requests += 1
+            self._condition.notify_all()  # The next caller in line may fit too
+
+    def _release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def _record_success(self):
+        with self._condition:
+            # Additive increase: roughly +1 slot per full window of successful calls
+            self.concurrency_limit = min(
+                self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit
+            )
+            self._condition.notify_all()
+
+    def _record_error(self, error, retry):
+        with self._condition:
+            if retry:
+                self.retries += 1
+            else:
+                self.failures += 1
+            if is_rate_limited(error):
+                # Multiplicative decrease when the quota pushes back
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "active": self.active,
+                "waiting": len(self._waiting),
+                "concurrency_limit": round(self.concurrency_limit, 2),
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler, so every session and batch worker shares one quota"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(
+                requests_per_minute=int(os.getenv("MODEL_REQUESTS_PER_MINUTE", 60)),
+                tokens_per_minute=int(os.getenv("MODEL_TOKENS_PER_MINUTE", 1_000_000)),
+                max_concurrency=int(os.getenv("MODEL_MAX_CONCURRENCY", 8)),
+                max_retries=int(os.getenv("MODEL_MAX_RETRIES", 5)),
+            )
+        return _scheduler
@@ -0,0 +1,215 @@
+import difflib
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+
+from caching import CountedLRUCache
+from summarizer import CLAUSE_BOUNDARY, PAGE_MARKER
+
+WORD = re.compile(r"\w+")
+DIGIT = re.compile(r"\d")
+SHINGLE_WORDS = 5
+# 32 bands of 4 rows: documents sharing roughly 40% or more of their shingles usually land in a common
+# bucket, and the threshold is then checked against the full signature
+NUM_HASHES = 128
+BANDS = 32
+ROWS = NUM_HASHES // BANDS
+EMPTY = 0xFFFFFFFF
+
+Match = namedtuple("Match", "key similarity name")
+# One differing run of clauses: the original's text and the new document's, either may be empty
+Change = namedtuple("Change", "page old new")
+
+
+def shingles(text):
+    """Hashes of overlapping SHINGLE_WORDS-word runs, with digits masked so changed amounts and dates still match"""
+    words = WORD.findall(DIGIT.sub("0", PAGE_MARKER.sub(" ", text).lower()))
+    if len(words) < SHINGLE_WORDS:
+        words = words + [""] * (SHINGLE_WORDS - len(words))
+    return {
+        zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8"))
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+def signature(text):
+    """MinHash signature with one hash per shingle (one-permutation hashing)
+
+    Each shingle hash falls into one of NUM_HASHES bins by its low bits and the minimum of the rest is kept
+    per bin, so a document costs a single pass instead of NUM_HASHES. Empty bins (very short documents)
+    borrow from the next filled bin so that two signatures stay comparable position by position.
+    """
+    bins = [EMPTY] * NUM_HASHES
+    for value in shingles(text):
+        slot = value % NUM_HASHES
+        value //= NUM_HASHES
+        if value < bins[slot]:
+            bins[slot] = value
+    filled = [slot for slot, value in enumerate(bins) if value != EMPTY]
+    if filled and len(filled) < NUM_HASHES:
+        for slot in range(NUM_HASHES):
+            if bins[slot] == EMPTY:
+                donor = next((s for s in filled if s > slot), filled[0])
+                # Offset by the distance borrowed so that different gaps don't collide by construction
+                bins[slot] = (bins[donor] + (donor - slot) % NUM_HASHES * 0x9E3779B1) & 0xFFFFFFFF
+    return tuple(bins)
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of the two documents' shingle sets"""
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / NUM_HASHES
+
+
+def bands(sig):
+    return [(band, sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class SimilarityIndex:
+    """LSH index of MinHash signatures for finding earlier documents built from the same template
+
+    Keeps the text of the last max_documents documents (compressed) so their clauses can be compared.
+    """
+
+    def __init__(self, max_documents=64):
+        self.max_documents = max_documents
+        self._documents = OrderedDict()  # key -> (signature, compressed text, name)
+        self._buckets = {}  # (band, rows) -> set of keys
+        self._lock = threading.Lock()
+
+    def add(self, key, text, name=None, sig=None):
+        sig = sig or signature(text)
+        packed = zlib.compress(text.encode("utf-8"), 1)
+        with self._lock:
+            if key in self._documents:
+                self._documents.move_to_end(key)
+                return
+            self._documents[key] = (sig, packed, name)
+            for bucket in bands(sig):
+                self._buckets.setdefault(bucket, set()).add(key)
+            while len(self._documents) > self.max_documents:
+                self._remove(next(iter(self._documents)))
+
+    def _remove(self, key):
+        sig, _, _ = self._documents.pop(key)
+        for bucket in bands(sig):
+            keys = self._buckets.get(bucket)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._buckets[bucket]
+
+    def query(self, sig, threshold=0.8):
+        """Matches at or above threshold, most similar first; only documents sharing an LSH bucket are compared"""
+        with self._lock:
+            candidates = set()
+            for bucket in bands(sig):
+                candidates.update(self._buckets.get(bucket, ()))
+            matches = [
+                Match(key, similarity(sig, self._documents[key][0]), self._documents[key][2]) for key in candidates
+            ]
+        return sorted((m for m in matches if m.similarity >= threshold), key=lambda m: -m.similarity)
+
+    def text(self, key):
+        with self._lock:
+            entry = self._documents.get(key)
+        return zlib.decompress(entry[1]).decode("utf-8") if entry else None
+
+    def __len__(self):
+        return len(self._documents)
+
+
+def clauses(text):
+    """(page_number, clause text) at the clause boundaries the summarizer uses, whitespace collapsed"""
+    result = []
+    page = None
+    pieces = []
+    start = 0
+    for boundary in CLAUSE_BOUNDARY.finditer(text):
+        pieces.append(text[start:boundary.start()])
+        start = boundary.start()
+    pieces.append(text[start:])
+    for piece in pieces:
+        for marker in PAGE_MARKER.finditer(piece):
+            page = int(marker.group(1))
+        piece = " ".join(PAGE_MARKER.sub(" ", piece).split())
+        if piece:
+            result.append((page, piece))
+    return result
+
+
+def changed_clauses(old_text, new_text):
+    """Runs of clauses that differ between two versions of a document, in the new document's order"""
+    old_clauses = clauses(old_text)
+    new_clauses = clauses(new_text)
+    matcher = difflib.SequenceMatcher(
+        None, [text for _, text in old_clauses], [text for _, text in new_clauses], autojunk=False
+    )
+    changes = []
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        page = new_clauses[new_start][0] if new_start < new_end else (
+            old_clauses[old_start][0] if old_start < old_end else None
+        )
+        changes.append(Change(
+            page,
+            "\n".join(text for _, text in old_clauses[old_start:old_end]),
+            "\n".join(text for _, text in new_clauses[new_start:new_end]),
+        ))
+    return changes
+
+
+def format_changes(changes, max_chars=20000):
+    """Before/after text of each change for the update prompt, cut off at max_chars"""
+    blocks = []
+    size = 0
+    for change in changes:
+        block = (
+            f"[Page {change.page or '-'}]\n"
+            f"Before: {change.old or '(not in the original)'}\n"
+            f"After: {change.new or '(removed)'}"
+        )
+        if size + len(block) > max_chars:
+            blocks.append(f"... and {len(changes) - len(blocks)} more changes")
+            break
+        blocks.append(block)
+        size += len(block) + 2
+    return "\n\n".join(blocks)
+
+
+def format_diff(changes):
+    """Changed clauses as diff lines ("- " original, "+ " new) for display"""
+    lines = []
+    for change in changes:
+        lines.append(f"@@ page {change.page or '-'} @@")
+        lines.extend(f"- {line}" for line in change.old.splitlines())
+        lines.extend(f"+ {line}" for line in change.new.splitlines())
+    return "\n".join(lines)
+
+
+_signature_cache = CountedLRUCache(int(os.getenv("SIMILARITY_CACHE_SIZE", 32)))
+_changes_cache = CountedLRUCache(int(os.getenv("SIMILARITY_CACHE_SIZE", 32)))
+
+
+def get_signature(document_hash, text):
+    """Compute a document's signature once and share it across requests and sessions"""
+    return _signature_cache.get_or_create(document_hash, lambda: signature(text))
+
+
+def get_changes(old_hash, old_text, new_hash, new_text):
+    return _changes_cache.get_or_create((old_hash, new_hash), lambda: changed_clauses(old_text, new_text))
+
+
+_similarity_index = None
+_similarity_index_lock = threading.Lock()
+
+
+def get_similarity_index():
+    """Process-wide index, so an upload is matched against documents analysed in any session"""
+    global _similarity_index
+    with _similarity_index_lock:
+        if _similarity_index is None:
+            _similarity_index = SimilarityIndex(int(os.getenv("SIMILARITY_INDEX_SIZE", 64)))
+        return _similarity_index
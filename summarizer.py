@@ -0,0 +1,141 @@
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from prompts import ANALYSIS_PROMPTS, CHUNK_FOCUS, CHUNK_PROMPT, REDUCE_NOTES
+from tracing import propagate
+
+PAGE_MARKER = re.compile(r"^--- Page (\d+) ---$", re.M)
+
+# A blank line, or a line opening with a clause number ("12.", "4.2", "(b)") or heading keyword
+CLAUSE_BOUNDARY = re.compile(
+    r"\n\s*\n|\n(?=[ \t]*(?:\d+(?:\.\d+)*[.)]?|\([a-z0-9]+\)|ARTICLE|Article|SECTION|Section)[ \t])"
+)
+
+Chunk = namedtuple("Chunk", "first_page last_page text")
+
+
+def split_pages(text):
+    """Split extracted text on its page markers into (page_number, text) pairs"""
+    markers = list(PAGE_MARKER.finditer(text))
+    if not markers:
+        return [(None, text)]
+
+    pages = []
+    if text[:markers[0].start()].strip():
+        pages.append((None, text[:markers[0].start()]))
+    for marker, next_marker in zip(markers, markers[1:] + [None]):
+        end = next_marker.start() if next_marker else len(text)
+        pages.append((int(marker.group(1)), text[marker.start():end]))
+    return pages
+
+
+def split_clauses(text, max_chars):
+    """Split text at clause boundaries, hard-wrapping any clause longer than max_chars"""
+    pieces = []
+    start = 0
+    for boundary in CLAUSE_BOUNDARY.finditer(text):
+        pieces.append(text[start:boundary.start()])
+        start = boundary.start()
+    pieces.append(text[start:])
+
+    for piece in pieces:
+        for offset in range(0, len(piece), max_chars):
+            yield piece[offset:offset + max_chars]
+
+
+def chunk_document(text, max_chars):
+    """Pack whole pages, or clauses of oversized pages, into chunks of at most max_chars"""
+    return list(chunk_pages(split_pages(text), max_chars))
+
+
+def chunk_pages(pages, max_chars):
+    """Yield chunks from a stream of (page_number, text) records without joining the whole document"""
+    parts = []
+    size = 0
+    first_page = last_page = None
+
+    for page_number, page_text in pages:
+        segments = [page_text] if len(page_text) <= max_chars else split_clauses(page_text, max_chars)
+        for segment in segments:
+            if parts and size + len(segment) > max_chars:
+                yield Chunk(first_page, last_page, "".join(parts))
+                parts, size = [], 0
+            if not parts:
+                first_page = page_number
+            parts.append(segment)
+            size += len(segment)
+            last_page = page_number
+
+    if parts:
+        yield Chunk(first_page, last_page, "".join(parts))
+
+
+def describe_pages(chunk):
+    if chunk.first_page is None:
+        return "an unnumbered section"
+    if chunk.first_page == chunk.last_page:
+        return f"page {chunk.first_page}"
+    return f"pages {chunk.first_page}-{chunk.last_page}"
+
+
+class MapReduceSummarizer:
+    """Analyse long documents by summarising chunks in parallel and reducing the notes
+
+    generate(prompt, label=..., **call_info) returns the model's text. With count_tokens and
+    max_prompt_tokens, documents whose prompt would exceed the budget are chunked too, and
+    chunks are sized to fit it.
+    """
+
+    def __init__(self, generate, chunk_chars=60000, max_workers=4, count_tokens=None, max_prompt_tokens=None):
+        self.generate = generate
+        self.chunk_chars = chunk_chars
+        self.max_workers = max_workers
+        self.count_tokens = count_tokens
+        self.max_prompt_tokens = max_prompt_tokens
+
+    def final_prompt(self, text, analysis_type="summary", structure=None, **call_info):
+        """Run the map stage if needed and return the prompt for the final call
+
+        structure, the document's DocumentModel if it has one, supplies the chunks from its offsets.
+        """
+        prompt = ANALYSIS_PROMPTS[analysis_type]
+        chunk_chars = self._chunk_chars(text)
+        if len(text) <= chunk_chars:
+            return prompt.format(text=text)
+
+        chunks = structure.chunks(chunk_chars) if structure is not None else chunk_document(text, chunk_chars)
+        notes = self.map_chunks(chunks, analysis_type, **call_info)
+        combined = "\n\n".join(notes)
+
+        # Collapse the notes again if they are still too large for a single reduce call
+        while len(combined) > chunk_chars and len(notes) > 1:
+            notes = self.map_chunks(chunk_document(combined, chunk_chars), analysis_type, **call_info)
+            collapsed = "\n\n".join(notes)
+            if len(collapsed) >= len(combined):
+                break
+            combined = collapsed
+
+        return prompt.format(text=REDUCE_NOTES.format(notes=combined))
+
+    def _chunk_chars(self, text):
+        """Chunk size in characters, shrunk if needed so a chunk's prompt stays inside the token budget"""
+        if not (self.count_tokens and self.max_prompt_tokens and text):
+            return self.chunk_chars
+        chars_per_token = len(text) / max(1, self.count_tokens(text))
+        # Leave a fifth of the budget for the instructions around the document text
+        return max(1000, min(self.chunk_chars, int(self.max_prompt_tokens * 0.8 * chars_per_token)))
+
+    def map_chunks(self, chunks, analysis_type, **call_info):
+        """Summarise every chunk concurrently, returning notes in document order"""
+        def summarize(chunk):
+            location = describe_pages(chunk)
+            notes = self.generate(
+                CHUNK_PROMPT.format(location=location, focus=CHUNK_FOCUS[analysis_type], text=chunk.text),
+                label=f"{analysis_type} ({location})",
+                **call_info,
+            )
+            return f"### Notes from {location}\n{notes.strip()}"
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(propagate(summarize), chunks))
@@ -0,0 +1,92 @@
+import io
+import uuid
+
+import pytest
+
+from extraction import TEXT_TYPE
+from jobs import DONE, FAILED
+
+
+@pytest.fixture
+def legal_ai(monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "fake")
+    monkeypatch.setenv("FAKE_MODEL_LATENCY", "0")
+    monkeypatch.setenv("FAKE_MODEL_TOKENS_PER_SECOND", "1000000")
+    from app import LegalDocumentAI
+
+    return LegalDocumentAI()
+
+
+def agreement(clauses=30):
+    """A document no other test has analysed, so the process-wide caches start cold for it"""
+    return f"Agreement {uuid.uuid4()}.\n\n" + "\n\n".join(
+        f"{n}. The Borrower pays a fee of ${n}0 if payment {n} is late." for n in range(1, clauses)
+    )
+
+
+def test_analysis_is_cached(legal_ai):
+    text = agreement()
+    first = legal_ai.simplify_legal_text(text, "summary")
+    calls = legal_ai.model.calls
+    assert first and not first.startswith("Error")
+    assert legal_ai.simplify_legal_text(text, "summary") == first
+    assert "".join(legal_ai._stream_analysis(text, "summary")) == first
+    assert legal_ai.model.calls == calls
+    assert legal_ai.tokens.totals(legal_ai._document_hash(text))["calls"] == 1
+
+
+def test_streamed_analysis_matches_the_model_text(legal_ai):
+    text = agreement()
+    job = legal_ai.submit_analysis(text, "risks")
+    assert job.wait(10) and job.status == DONE
+    assert job.result == "".join(job.parts) == legal_ai.simplify_legal_text(text, "risks")
+
+
+def test_failed_job_is_retried_on_the_next_submit(legal_ai, monkeypatch):
+    text = agreement()
+
+    def quota_error(*args, **kwargs):
+        raise RuntimeError("quota")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(legal_ai, "_generate_content", quota_error)
+        job = legal_ai.submit_analysis(text, "summary", name="loan.pdf")
+        assert job.wait(10) and job.status == FAILED
+        assert "quota" in job.error
+
+    retried = legal_ai.submit_analysis(text, "summary", name="loan.pdf")
+    assert retried is not job
+    assert retried.wait(10) and retried.status == DONE and not retried.result.startswith("Error")
+    assert legal_ai.submit_analysis(text, "summary", name="loan.pdf") is retried
+
+
+def test_long_document_questions_send_retrieved_passages(legal_ai, monkeypatch):
+    monkeypatch.setattr(legal_ai, "retrieval_min_chars", 2000)
+    monkeypatch.setattr(legal_ai, "retrieval_top_k", 2)
+    text = agreement(300)
+    prompt = legal_ai._question_prompt(legal_ai._document_hash(text), text, "What is the fee if payment 7 is late?")
+    assert "fee of $70 " in prompt and "fee of $2900 " not in prompt
+    assert len(prompt) < len(text)
+    assert legal_ai.analyze_specific_clause(text, "What is the fee if payment 7 is late?")
+
+
+class Upload(io.BytesIO):
+    """In-memory stand-in for a Streamlit UploadedFile"""
+
+    def __init__(self, name, text):
+        super().__init__(text.encode("utf-8"))
+        self.name = name
+        self.type = TEXT_TYPE
+
+
+def test_memory_limit_covers_all_of_a_sessions_uploads(legal_ai, monkeypatch):
+    errors = []
+    monkeypatch.setattr("app.st.error", errors.append)
+    legal_ai.session_memory_limit = 6000  # One of these documents while it is read, not two
+    first, second = Upload("a.txt", agreement()), Upload("b.txt", agreement())
+    assert legal_ai.extract_text_from_file(first)
+    assert legal_ai.extract_text_from_file(second) == ""
+    assert "memory limit" in errors[0]
+
+    legal_ai.keep_uploads(["b.txt"])
+    assert legal_ai.extract_text_from_file(Upload("b.txt", agreement()))
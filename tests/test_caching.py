@@ -0,0 +1,185 @@
+import threading
+import time
+
+import pytest
+
+from caching import CountedLRUCache, FlightAbandoned, LRUCache, MemoryBackend, ResponseCache, SingleFlight, SQLiteBackend
+from clients import ContextCache
+
+
+def test_lru_evicts_least_recently_used_by_size():
+    cache = LRUCache(10)
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    assert cache.get("a") == "aaaa"  # Now more recent than b
+    cache.set("c", "cccc")
+    assert "b" not in cache
+    assert cache.get("a") == "aaaa" and cache.get("c") == "cccc"
+    assert cache.size == 8
+
+
+def test_lru_skips_values_larger_than_the_cache():
+    cache = LRUCache(3)
+    cache.set("small", "ab")
+    cache.set("large", "abcd")
+    assert "large" not in cache and cache.get("small") == "ab"
+
+
+def test_lru_replace_and_pop_keep_size():
+    cache = LRUCache(10)
+    cache.set("a", "aaaa")
+    cache.set("a", "aa")
+    assert cache.size == 2
+    assert cache.pop("a") == "aa"
+    assert cache.size == 0 and cache.pop("a", "gone") == "gone"
+
+
+def test_get_or_create_builds_once_for_concurrent_callers():
+    cache = CountedLRUCache(2)
+    builds = []
+    release = threading.Event()
+
+    def build():
+        builds.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("a", build))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["value"] * 4 and len(builds) == 1
+
+
+def test_get_or_create_retries_after_a_failed_build():
+    cache = CountedLRUCache(2)
+
+    def fail():
+        raise RuntimeError("parse error")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_create("a", fail)
+    assert cache.get_or_create("a", lambda: "value") == "value"
+    assert cache.get_or_create("a", fail) == "value"
+
+
+def test_response_cache_counts_concurrent_lookups():
+    cache = ResponseCache(MemoryBackend())
+    cache.set("cached", "analysis")
+
+    def lookups():
+        for _ in range(2000):
+            cache.get("cached")
+            cache.get("missing")
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats() == {"hits": 16000, "misses": 16000, "hit_rate": 0.5}
+
+
+def test_sqlite_backend_keeps_most_recently_used(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "responses.sqlite3"), max_entries=2)
+    backend.set("a", (None, "first"))
+    time.sleep(0.01)
+    backend.set("b", (None, "second"))
+    time.sleep(0.01)
+    assert backend.get("a") == (None, "first")  # Touches a, so b is now the oldest
+    time.sleep(0.01)
+    backend.set("c", (None, "third"))
+    assert backend.get("b") is None
+    assert backend.get("a") == (None, "first") and backend.get("c") == (None, "third")
+
+
+def test_response_cache_counts_hits_and_expires_entries(tmp_path):
+    cache = ResponseCache(SQLiteBackend(str(tmp_path / "responses.sqlite3")), ttl=60)
+    key = ResponseCache.make_key("document", "summary", "1", "model")
+    assert cache.get(key) is None
+    cache.set(key, "analysis")
+    assert cache.get(key) == "analysis"
+    assert cache.peek(key) == "analysis"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+    cache.backend.set(key, (time.time() - 1, "stale"))
+    assert cache.get(key) is None
+    assert cache.backend.get(key) is None
+
+
+def test_make_key_separates_parts():
+    assert ResponseCache.make_key("ab", "c") != ResponseCache.make_key("a", "bc")
+
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("key", slow_call)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do("key", slow_call))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while flights.stats()["shared"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 3
+    assert flights.stats() == {"leaders": 1, "shared": 3, "in_flight": 0}
+
+
+def test_single_flight_shares_errors_and_forgets_finished_calls():
+    flights = SingleFlight()
+
+    def failing():
+        raise ValueError("quota")
+
+    with pytest.raises(ValueError):
+        flights.do("key", failing)
+    assert flights.do("key", lambda: "retried") == ("retried", False)
+
+
+def test_single_flight_follower_takes_over_an_abandoned_call():
+    flights = SingleFlight()
+    future, leader = flights.begin("key")
+    assert leader
+    result = []
+    follower = threading.Thread(target=lambda: result.append(flights.do("key", lambda: "from follower")))
+    follower.start()
+    while flights.stats()["shared"] < 1:
+        time.sleep(0.001)
+    flights.finish("key", error=FlightAbandoned())
+    follower.join(5)
+    assert result == [("from follower", False)]
+
+
+def test_context_cache_logs_and_remembers_a_failed_context(caplog):
+    cache = ContextCache(ttl_seconds=600)
+    attempts = []
+
+    def unsupported(ttl_seconds):
+        attempts.append(ttl_seconds)
+        raise RuntimeError("model does not support context caching")
+
+    with caplog.at_level("WARNING", logger="clients"):
+        assert cache.get(("model", "document", "1"), unsupported) is None
+        assert cache.get(("model", "document", "1"), unsupported) is None
+    assert attempts == [600] and cache.failed == 1
+    assert "context_cache_failed" in caplog.text and "does not support context caching" in caplog.text
@@ -0,0 +1,66 @@
+import pytest
+
+from document import DocumentModel, DocumentModelBuilder
+from extraction import format_pages
+from summarizer import chunk_document
+
+
+def lease(pages=6):
+    parts = ["Residential Lease Agreement\n\n"]
+    for page in range(1, pages + 1):
+        parts.append(f"\n--- Page {page} ---\n")
+        for clause in range(1, 4 + page):
+            parts.append(f"{page}.{clause} The Tenant shall pay a fee of ${page * clause}.00 on the first day. " * 3)
+            parts.append("\n")
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("max_chars", [80, 250, 1000, 4000, 100_000])
+def test_chunks_match_chunk_document(max_chars):
+    text = lease()
+    assert DocumentModel(text).chunks(max_chars) == chunk_document(text, max_chars)
+
+
+@pytest.mark.parametrize("max_chars", [250, 1000])
+def test_chunk_spans_are_contiguous_slices(max_chars):
+    text = lease()
+    spans = list(DocumentModel(text).chunk_spans(max_chars))
+    assert spans[0][2] == 0 and spans[-1][3] == len(text)
+    for (_, _, _, end), (_, _, start, _) in zip(spans, spans[1:]):
+        assert end == start
+
+
+def test_per_page_chunks_never_cross_a_page():
+    model = DocumentModel(lease())
+    for first_page, last_page, start, end in model.chunk_spans(1000, per_page=True):
+        assert first_page == last_page
+        assert end - start <= 1000
+
+
+def test_pages_match_page_markers():
+    model = DocumentModel(lease(3))
+    assert [number for number, _ in model.pages()] == [None, 1, 2, 3]
+    assert model.page_of(model.text.index("--- Page 2 ---") + 20) == 2
+
+
+def offsets(model):
+    return {
+        name: list(value) if not hasattr(value, "starts") else (list(value.starts), list(value.ends))
+        for name, value in ((name, getattr(model, name)) for name in DocumentModel.__slots__)
+    }
+
+
+@pytest.mark.parametrize("pages", [
+    [(1, "The \"Rent\""), (2, "means $500 a month.\n 1.2 ")],
+    [(None, "  ARTICLE 1 TERM"), (None, "The \"Deposit\""), (None, "\n  means USD 4 million, due"), (None, "March 3, 2025\n")],
+    [(None, "Lead-in text\n\n1. Payment"), (3, ""), (4, "TERMINATION \n7) Either party"), (5, "  \n\n")],
+    [(1, "   "), (2, "\n\n")],
+])
+def test_builder_matches_model_of_joined_pages(pages):
+    builder = DocumentModelBuilder()
+    for page_number, page_text in pages:
+        builder.add(page_number, page_text)
+    text, model = builder.build()
+    assert text == format_pages(pages).strip()
+    assert offsets(model) == offsets(DocumentModel(text))
+
@@ -0,0 +1,102 @@
+import io
+import zipfile
+
+import docx
+import pytest
+
+from extraction import DOCX_TYPE, format_pages, iter_docx_lines, iter_docx_records, iter_document_pages
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+MC = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+WPS = "http://schemas.microsoft.com/office/word/2010/wordprocessingShape"
+
+
+def docx_bytes(document):
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def paragraph(text):
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def text_box(*lines):
+    """A floating text box as Word saves it: a DrawingML shape, with a VML copy of the same text as fallback"""
+    content = "".join(paragraph(line) for line in lines)
+    return (
+        "<w:r><mc:AlternateContent>"
+        f"<mc:Choice Requires=\"wps\"><w:drawing><wps:wsp><wps:txbx><w:txbxContent>{content}"
+        "</w:txbxContent></wps:txbx></wps:wsp></w:drawing></mc:Choice>"
+        f"<mc:Fallback><w:pict><v:shape><v:textbox><w:txbxContent>{content}"
+        "</w:txbxContent></v:textbox></v:shape></w:pict></mc:Fallback>"
+        "</mc:AlternateContent></w:r>"
+    )
+
+
+def raw_docx(body):
+    document = (
+        f'<w:document xmlns:w="{W}" xmlns:mc="{MC}" xmlns:wps="{WPS}" xmlns:v="urn:schemas-microsoft-com:vml">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="module")
+def agreement():
+    document = docx.Document()
+    document.sections[0].header.paragraphs[0].text = "ACME Lease - Confidential"
+    document.sections[0].footer.paragraphs[0].text = "Initials: ____"
+    document.add_paragraph("1. The Tenant shall pay rent.\tMonthly")
+    lines = document.add_paragraph("Line one")
+    lines.add_run().add_break()
+    lines.add_run("line two")
+    table = document.add_table(rows=2, cols=3)
+    for row in range(2):
+        for column in range(3):
+            table.cell(row, column).text = f"r{row}c{column}"
+    table.cell(1, 1).add_paragraph("second paragraph")
+    document.add_page_break()
+    document.add_paragraph("")
+    document.add_paragraph("2. A late fee of $50 applies.")
+    return docx_bytes(document)
+
+
+def test_body_paragraphs_match_python_docx(agreement):
+    without_tables = docx.Document(io.BytesIO(agreement))
+    expected = [paragraph.text for paragraph in without_tables.paragraphs]
+    lines = [line for line in iter_docx_lines(agreement) if " | " not in line]
+    assert lines[1:-1] == expected
+
+
+def test_headers_tables_and_footers(agreement):
+    lines = list(iter_docx_lines(agreement))
+    assert lines[0] == "ACME Lease - Confidential"
+    assert lines[-1] == "Initials: ____"
+    assert "r0c0 | r0c1 | r0c2" in lines
+    assert "r1c0 | r1c1 second paragraph | r1c2" in lines
+
+
+def test_records_are_byte_identical_to_whole_document(agreement):
+    whole = "\n".join(iter_docx_lines(agreement)) + "\n"
+    for record_chars in (1, 16, 1 << 16):
+        assert format_pages(iter_docx_records(agreement, record_chars)) == whole
+    assert format_pages(iter_document_pages(agreement, DOCX_TYPE)) == whole
+
+
+def test_text_box_is_read_once_on_its_own_lines():
+    data = raw_docx(
+        paragraph("Before")
+        + f"<w:p><w:r><w:t>Anchor</w:t></w:r>{text_box('Boxed one', 'Boxed two')}</w:p>"
+        + paragraph("After")
+    )
+    assert list(iter_docx_lines(data)) == ["Before", "Anchor", "Boxed one", "Boxed two", "After"]
+
+
+def test_text_box_in_table_cell_stays_in_the_cell():
+    cell = f"<w:tc><w:p><w:r><w:t>Fee</w:t></w:r>{text_box('Note')}</w:p></w:tc>"
+    data = raw_docx(f"<w:tbl><w:tr>{cell}<w:tc>{paragraph('$50')}</w:tc></w:tr></w:tbl>")
+    assert list(iter_docx_lines(data)) == ["Fee Note | $50"]
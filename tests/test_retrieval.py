@@ -0,0 +1,36 @@
+from document import DocumentModel
+from retrieval import build_passages_from_model, DocumentIndex, tokenize
+
+TEXT = (
+    "--- Page 1 ---\n"
+    "1. Rent. The Tenant pays rent of $1,200 each month.\n\n"
+    "2. Deposit. A security deposit of $2,400 is held by the Landlord.\n"
+    "--- Page 2 ---\n"
+    "3. Termination. Either party may terminate with sixty days written notice.\n\n"
+    "4. Late fees. A late fee of $75 applies after five days.\n"
+)
+
+
+def index():
+    return DocumentIndex(build_passages_from_model(DocumentModel(TEXT), max_chars=80))
+
+
+def test_tokenize_drops_stopwords_and_keeps_amounts():
+    assert tokenize("What is the late fee of $1,200.50?") == ["late", "fee", "1,200.50"]
+
+
+def test_bm25_ranks_the_matching_clause_first():
+    best = index().search("how much is the security deposit", top_k=2)[0]
+    assert "security deposit" in best.text and best.page == 1
+    best = index().search("terminate with notice", top_k=1)[0]
+    assert best.text.startswith("3. Termination") and best.page == 2
+
+
+def test_no_match_falls_back_to_opening_passages():
+    passages = index().search("zebra", top_k=2)
+    assert [passage.index for passage in passages] == [0, 1]
+
+
+def test_passage_at_finds_the_passage_holding_an_offset():
+    passage = index().passage_at(TEXT.index("A late fee"))
+    assert passage.text.startswith("4. Late fees")
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import ANALYSIS, BATCH, INTERACTIVE, RequestScheduler
+
+
+class ResourceExhausted(Exception):
+    """Named like the google.api_core quota error the scheduler recognises"""
+
+
+def scheduler(**kwargs):
+    kwargs.setdefault("requests_per_minute", 10_000)
+    kwargs.setdefault("base_delay", 0.0)
+    return RequestScheduler(**kwargs)
+
+
+def test_concurrency_limit_is_respected():
+    limited = scheduler(max_concurrency=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.pop()
+
+    threads = [threading.Thread(target=limited.call, args=(call,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert max(peak) == 2
+    assert limited.stats()["requests"] == 6 and limited.stats()["active"] == 0
+
+
+def test_waiting_calls_run_in_priority_order():
+    ordered = scheduler(max_concurrency=1)
+    gate = threading.Event()
+    order = []
+    holder = threading.Thread(target=ordered.call, args=(gate.wait, 5))
+    holder.start()
+    while ordered.stats()["active"] < 1:
+        time.sleep(0.001)
+
+    threads = []
+    for priority in (BATCH, ANALYSIS, INTERACTIVE):
+        thread = threading.Thread(target=ordered.call, args=(order.append, priority), kwargs={"priority": priority})
+        thread.start()
+        threads.append(thread)
+        while ordered.stats()["waiting"] < len(threads):
+            time.sleep(0.001)
+    gate.set()
+    for thread in [holder, *threads]:
+        thread.join(5)
+    assert order == [INTERACTIVE, ANALYSIS, BATCH]
+
+
+def test_retries_transient_errors_and_halves_concurrency_on_rate_limits():
+    retrying = scheduler(max_concurrency=8)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ResourceExhausted("quota")
+        return "ok"
+
+    assert retrying.call(flaky) == "ok"
+    stats = retrying.stats()
+    assert stats["retries"] == 2 and stats["failures"] == 0
+    assert stats["concurrency_limit"] < 8
+
+
+def test_other_errors_are_not_retried():
+    strict = scheduler()
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        strict.call(broken)
+    assert len(attempts) == 1 and strict.stats()["failures"] == 1
+
+
+def test_streamed_response_holds_its_slot_until_the_stream_ends():
+    streaming = scheduler()
+
+    def stream(stream=False):
+        yield from ("a", "b")
+
+    response = streaming.call(stream, stream=True)
+    assert streaming.stats()["active"] == 1
+    assert list(response) == ["a", "b"]
+    assert streaming.stats()["active"] == 0
+
+    response = streaming.call(stream, stream=True)
+    next(response)
+    response.close()
+    assert streaming.stats()["active"] == 0
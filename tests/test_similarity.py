@@ -0,0 +1,38 @@
+from similarity import changed_clauses, signature, similarity, SimilarityIndex
+
+TEMPLATE = "\n\n".join(
+    f"{number}. The Tenant agrees to clause {number} of this lease, paying ${number}00 where it applies "
+    f"and giving notice to the Landlord in writing before any change to section {number}."
+    for number in range(1, 40)
+)
+
+
+def test_identical_documents_have_identical_signatures():
+    assert similarity(signature(TEMPLATE), signature(TEMPLATE)) == 1.0
+
+
+def test_changed_amounts_still_match_and_other_documents_do_not():
+    amended = TEMPLATE.replace("$500", "$900").replace("$1200", "$1500")
+    unrelated = " ".join(f"Unrelated loan covenant {n} about interest and repayment schedules." for n in range(80))
+    assert similarity(signature(TEMPLATE), signature(amended)) > 0.9
+    assert similarity(signature(TEMPLATE), signature(unrelated)) < 0.2
+
+
+def test_index_finds_near_duplicates_and_evicts_oldest():
+    index = SimilarityIndex(max_documents=2)
+    index.add("lease", TEMPLATE, name="lease.pdf")
+    edited = TEMPLATE.replace("clause 7 of this lease", "clause 7 of this lease and its annex")
+    matches = index.query(signature(edited), threshold=0.8)
+    assert [match.key for match in matches] == ["lease"] and matches[0].name == "lease.pdf"
+
+    index.add("other-1", "completely different text about a car loan " * 20)
+    index.add("other-2", "another unrelated text about an insurance policy " * 20)
+    assert len(index) == 2 and index.text("lease") is None
+    assert index.query(signature(TEMPLATE)) == []
+
+
+def test_changed_clauses_reports_only_the_edit():
+    amended = TEMPLATE.replace("clause 12 of this lease", "clause 12 of this amended lease")
+    changes = changed_clauses(TEMPLATE, amended)
+    assert len(changes) == 1
+    assert "amended lease" in changes[0].new and "amended" not in changes[0].old
@@ -0,0 +1,21 @@
+import pytest
+
+from tokens import heuristic_token_count, PromptBudgetExceeded, TokenAccountant, trim_to_budget, TRUNCATION_NOTE
+
+
+@pytest.mark.parametrize("text", ["word " * 100000, "line of text\n" * 20000, "x" * 50000])
+@pytest.mark.parametrize("max_tokens", [100, 5000])
+def test_trimmed_text_fits_the_budget_with_its_note(text, max_tokens):
+    result = trim_to_budget(text, max_tokens, heuristic_token_count)
+    assert result.endswith(TRUNCATION_NOTE)
+    assert heuristic_token_count(result) <= max_tokens
+    TokenAccountant(max_prompt_tokens=max_tokens).check(heuristic_token_count(result))
+
+
+def test_text_within_budget_is_unchanged():
+    assert trim_to_budget("short text", 100, heuristic_token_count) == "short text"
+
+
+def test_over_budget_prompt_is_refused():
+    with pytest.raises(PromptBudgetExceeded):
+        TokenAccountant(max_prompt_tokens=10).check(11)
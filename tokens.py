@@ -0,0 +1,120 @@
+import importlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and single punctuation marks
+TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+TRUNCATION_NOTE = "\n\n[... document truncated to fit the request size limit ...]"
+
+# prompt_tokens includes cached_tokens, the part of the prompt read from a cached context
+CallRecord = namedtuple("CallRecord", "label document prompt_tokens completion_tokens seconds cached_tokens", defaults=(0,))
+
+
+class PromptBudgetExceeded(ValueError):
+    pass
+
+
+def heuristic_token_count(text):
+    """Local estimate of model tokens: about four characters per token, at least one per word or symbol"""
+    return max(len(text) // 4, len(TOKEN_PIECES.findall(text)))
+
+
+def load_tokenizer():
+    """Token counter named by TOKENIZER ("module:function"), defaulting to the local heuristic"""
+    spec = os.getenv("TOKENIZER")
+    if not spec:
+        return heuristic_token_count
+    module_name, _, function_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def trim_to_budget(text, max_tokens, count_tokens):
+    """Cut text, preferably at a line break, so it fits in max_tokens together with the truncation note"""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    budget = max_tokens - count_tokens(TRUNCATION_NOTE)
+    while True:
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+
+        cut = text.rfind("\n", 0, low)
+        if cut < low // 2:
+            cut = low
+        trimmed = text[:cut] + TRUNCATION_NOTE
+        # Counts needn't add up exactly across the join; tighten until the whole fits
+        excess = count_tokens(trimmed) - max_tokens
+        if excess <= 0 or cut == 0:
+            return trimmed
+        budget -= excess
+
+
+class TokenAccountant:
+    """Counts prompt tokens locally, enforces the per-request budget and records usage for each call"""
+
+    def __init__(self, count_tokens=None, max_prompt_tokens=100_000, history=500):
+        self.count = count_tokens or heuristic_token_count
+        self.max_prompt_tokens = max_prompt_tokens
+        self._records = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def check(self, prompt_tokens, label=None):
+        """Refuse a prompt that would exceed the budget before it is sent"""
+        if prompt_tokens > self.max_prompt_tokens:
+            logger.warning(json.dumps({
+                "event": "prompt_over_budget",
+                "label": label,
+                "prompt_tokens": prompt_tokens,
+                "budget": self.max_prompt_tokens,
+            }))
+            raise PromptBudgetExceeded(
+                f"Prompt of about {prompt_tokens:,} tokens exceeds the {self.max_prompt_tokens:,} token limit"
+            )
+
+    def record(self, label, document, prompt_tokens, completion_tokens, seconds, cached_tokens=0):
+        record = CallRecord(label, document, prompt_tokens, completion_tokens, round(seconds, 3), cached_tokens)
+        with self._lock:
+            self._records.append(record)
+        logger.info(json.dumps({"event": "model_call", **record._asdict()}))
+
+    def records(self, document=None):
+        with self._lock:
+            return [r for r in self._records if document is None or r.document == document]
+
+    def totals(self, document=None):
+        records = self.records(document)
+        return {
+            "calls": len(records),
+            "prompt_tokens": sum(r.prompt_tokens for r in records),
+            "completion_tokens": sum(r.completion_tokens for r in records),
+            "cached_tokens": sum(r.cached_tokens for r in records),
+            "seconds": round(sum(r.seconds for r in records), 3),
+        }
+
+
+def usage_tokens(response):
+    """(prompt, completion) token counts reported by the API, or (None, None) if absent"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return (
+        getattr(usage, "prompt_token_count", None) or None,
+        getattr(usage, "candidates_token_count", None) or None,
+    )
+
+
+def cached_tokens(response):
+    """Prompt tokens the API read from a cached context rather than the request (0 if none)"""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "cached_content_token_count", None) or 0
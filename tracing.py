@@ -0,0 +1,242 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "docsummarizer"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage; spans started while another is current become its children"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent", "start_ns", "end_ns", "attributes", "error", "children")
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.error = None
+        self.children = []
+        if parent:
+            parent.children.append(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.parent is None:
+                self.tracer._finish(self)
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def walk(self, depth=0):
+        """Yield (depth, span) for this span and its descendants in start order"""
+        yield depth, self
+        for child in sorted(self.children, key=lambda s: s.start_ns):
+            yield from child.walk(depth + 1)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+            "children": [child.to_dict() for child in sorted(self.children, key=lambda s: s.start_ns)],
+        }
+
+
+class JSONLogExporter:
+    """Write each finished trace as one JSON log line"""
+
+    def export(self, root):
+        logger.info(json.dumps({"event": "trace", **root.to_dict()}, default=str))
+
+
+class OTLPExporter:
+    """Post finished traces as OTLP/HTTP JSON to a collector from a background thread"""
+
+    def __init__(self, endpoint="http://localhost:4318/v1/traces", timeout=2.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=1000)
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+
+    def export(self, root):
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            pass  # Never block the app on telemetry
+
+    def _run(self):
+        import urllib.request
+
+        while True:
+            root = self._queue.get()
+            body = json.dumps(self.payload(root), default=str).encode("utf-8")
+            request = urllib.request.Request(
+                self.endpoint, data=body, headers={"Content-Type": "application/json"}
+            )
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except OSError as e:
+                logger.debug("OTLP export failed: %s", e)
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    @classmethod
+    def payload(cls, root):
+        spans = []
+        for _, span in root.walk():
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": k, "value": cls._value(v)} for k, v in span.attributes.items()],
+            }
+            if span.parent:
+                otlp_span["parentSpanId"] = span.parent.span_id
+            if span.error:
+                otlp_span["status"] = {"code": 2, "message": span.error}  # STATUS_CODE_ERROR
+            spans.append(otlp_span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+        }]}
+
+
+class Tracer:
+    """Collects spans into traces, keeps recent traces for the debug panel and hands them to exporters"""
+
+    def __init__(self, exporters=(), history=100):
+        self.exporters = list(exporters)
+        self._recent = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def start_span(self, name, **attributes):
+        """Start a span under the current one; the caller must call .end()"""
+        return Span(self, name, _current_span.get(), attributes)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    @contextmanager
+    def activate(self, span):
+        """Make a manually started span current for a block (for generators, which can't hold one across yields)"""
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    def _finish(self, root):
+        with self._lock:
+            self._recent.append(root)
+        for exporter in self.exporters:
+            try:
+                exporter.export(root)
+            except Exception as e:
+                logger.debug("Trace export failed: %s", e)
+
+    def recent(self, **attributes):
+        """Finished traces, newest first, whose root has all the given attribute values"""
+        with self._lock:
+            traces = list(self._recent)
+        return [
+            root for root in reversed(traces)
+            if all(root.attributes.get(k) == v for k, v in attributes.items())
+        ]
+
+
+def propagate(fn):
+    """Wrap fn so it runs under the caller's current span when called on a pool thread"""
+    parent = _current_span.get()
+
+    def run(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return run
+
+
+def log_json_lines(*names):
+    """Let the named loggers' INFO records through, to stderr as bare lines unless logging is configured already
+
+    Nothing configures logging under Streamlit or the batch CLI, and without a handler Python drops
+    INFO records, so the JSON lines would otherwise go nowhere.
+    """
+    for name in names:
+        named_logger = logging.getLogger(name)
+        named_logger.setLevel(logging.INFO)
+        if not named_logger.handlers and not logging.getLogger().handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            named_logger.addHandler(handler)
+            named_logger.propagate = False
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """Process-wide tracer; TRACE_EXPORT picks exporters ("log", "otlp" or both, comma-separated)
+
+    "log" writes each trace, and each model call's token usage record, as a JSON line to stderr.
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            exporters = []
+            for name in os.getenv("TRACE_EXPORT", "").lower().split(","):
+                name = name.strip()
+                if name == "log":
+                    log_json_lines(__name__, "tokens")
+                    exporters.append(JSONLogExporter())
+                elif name == "otlp":
+                    exporters.append(OTLPExporter(os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")))
+            _tracer = Tracer(exporters)
+        return _tracer